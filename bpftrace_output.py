@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Streaming reader of bpftrace map dumps.
+#
+# On exit, bpftrace prints every map as
+#
+#   @map[key1, key2, ...]: value
+#
+# lines. read_maps() walks such an output a bounded batch of lines at a
+# time and yields a (map, key tuple, value) record per line, the key items
+# as strings and the value as an int when it is one, so the output is never
+# held in memory. The values of the maps named in raw (eg. a comm, which may
+# be "007") are kept as strings. Each line is split in a single pass on its first ']:',
+# which a value may contain but a key should not. Other lines ("Attaching N
+# probes...", blank lines, histograms) are skipped.
+#
+# With -f json, bpftrace prints one JSON event per line instead, all of a
+# map in a single
+#
+#   {"type": "map", "data": {"@map": {"key1,key2,...": value, ...}}}
+#
+# one. Such lines are decoded one map at a time and yield the same records,
+# the values keeping their JSON type. Events without any of the maps asked
+# for are skipped without being decoded. A comm value may then contain any
+# character; in a key, where the items are joined by ',', a comm is only
+# safe after all the items that are used.
+
+import json
+
+batch_size = 1 << 20
+
+def get_value(s):
+    if s.isdigit() or (s[:1] == '-' and s[1:].isdigit()):
+        return int(s)
+
+    return s
+
+def parse_line(line, raw=()):
+    # (map, key tuple, value), None if line is not a map entry
+    if line[:1] != '@':
+        return None
+
+    (head, sep, value) = line.partition(']:')
+    if sep:
+        (name, sep, key) = head.partition('[')
+        if not sep:
+            return None
+        keys = (key.strip(),) if ', ' not in key else tuple(k.strip() for k in key.split(', '))
+    else:
+        (name, sep, value) = line.partition(':')
+        if not sep or '[' in name:
+            return None
+        keys = ()
+
+    name = name[1:]
+    value = value.strip()
+    if not value:
+        # Header of a histogram, printed on the following lines
+        return None
+
+    return (name, keys, value if name in raw else get_value(value))
+
+def has_maps(line, maps):
+    # Cheap check for the names of maps in a JSON event, before decoding it
+    return maps is None or any(('"@' + m + '"') in line for m in maps)
+
+def parse_json_line(line, maps=None):
+    # (map, key tuple, value) records of a JSON map event
+    event = json.loads(line)
+    if event.get('type') != 'map':
+        return
+
+    for (name, entries) in event['data'].items():
+        name = name.lstrip('@')
+        if maps is not None and name not in maps:
+            continue
+
+        if not isinstance(entries, dict):
+            yield (name, (), entries)
+            continue
+
+        for (key, value) in entries.items():
+            keys = (key,) if ',' not in key else tuple(k.strip() for k in key.split(','))
+            yield (name, keys, value)
+
+def read_maps(path, maps=None, raw=()):
+    # maps: names of the maps to yield, every map when None
+    # raw: names of the maps whose values are not converted to int
+    with open(path, 'r') as fin:
+        while True:
+            lines = fin.readlines(batch_size)
+            if not lines:
+                break
+
+            for line in lines:
+                if line[:1] == '{':
+                    if has_maps(line, maps):
+                        yield from parse_json_line(line, maps)
+                    continue
+
+                if line[:1] != '@':
+                    continue
+
+                record = parse_line(line, raw)
+                if record is None:
+                    continue
+
+                if maps is None or record[0] in maps:
+                    yield record
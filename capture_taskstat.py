@@ -1,22 +1,72 @@
 #!/usr/bin/python3
+#
+# Snapshot /proc/<pid>/task/<tid>/sched of every thread into the
+# <phase>.archive taskstat archive (see taskstat_archive.py).
+#
+# The processes are walked with os.scandir by a pool of threads, each one
+# reading the sched files of a batch of processes into memory; the archive
+# is only written once every thread has been read, to keep the snapshot
+# window short. Tasks exiting during the walk are skipped. The time each
+# thread was read at (CLOCK_MONOTONIC, ns) is written to <phase>.times as
+# "tid start end" lines, after a "window start end" one.
+#
+# The window is bound by the open() and read() of every sched file, the
+# kernel formatting it on read: about 20 us per thread on one CPU, which
+# only more CPUs bring down.
 
 import os
 import sys
-import shutil
+import time
+import concurrent.futures
+import taskstat_archive
 
-tasks = os.listdir("/proc")
+batch_size = 64
 
-for task in tasks:
-    if not task.isdigit():
-        continue
+def capture_threads(pids):
+    # [(tid, start, end, sched)] of the threads of pids
+    snapshots = []
 
-    task_dir = os.path.join("/proc", task)
-    thread_dir = os.path.join(task_dir, "task")
-    threads = os.listdir(thread_dir)
-    for thread in threads:
-        if not thread.isdigit():
+    for pid in pids:
+        task_dir = "/proc/" + pid + "/task/"
+        try:
+            with os.scandir(task_dir) as threads:
+                tids = [thread.name for thread in threads if thread.name.isdigit()]
+        except (FileNotFoundError, ProcessLookupError):
             continue
 
-        source = os.path.join(thread_dir, thread, "sched")
-        dest = os.path.join(sys.argv[1], thread)
-        shutil.copyfile(source, dest)
+        for tid in tids:
+            start = time.monotonic_ns()
+            try:
+                with open(task_dir + tid + "/sched", "rb") as sched_file:
+                    sched = sched_file.read()
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+
+            if sched:
+                snapshots.append((tid, start, time.monotonic_ns(), sched))
+
+    return snapshots
+
+def capture(jobs=None):
+    # (window start, window end, snapshots)
+    start = time.monotonic_ns()
+
+    with os.scandir("/proc") as tasks:
+        pids = [task.name for task in tasks if task.name.isdigit()]
+
+    batches = [pids[i:i + batch_size] for i in range(0, len(pids), batch_size)]
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        snapshots = [s for batch in pool.map(capture_threads, batches) for s in batch]
+
+    return (start, time.monotonic_ns(), snapshots)
+
+if __name__ == "__main__":
+    dest_path = sys.argv[1].rstrip("/")
+    (start, end, snapshots) = capture()
+
+    with open(dest_path + ".times", "w") as times_file, taskstat_archive.TaskStatWriter(dest_path) as archive:
+        times_file.write("window %d %d\n" %(start, end))
+
+        for (tid, tid_start, tid_end, sched) in snapshots:
+            archive.append(tid, sched)
+            times_file.write("%s %d %d\n" %(tid, tid_start, tid_end))
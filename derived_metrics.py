@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Compiled derived-metric engine.
+#
+# A derived metric is described the same way as in the vNN.json files:
+#
+#   { "key" : ..., "function" : "<python expression on a[]>", "values" : [...] }
+#
+# where a[i] is the value of values[i]. Each expression is compiled once into
+# two code objects: the expression as written, evaluated on a list of scalars,
+# and a vectorized rewrite of it evaluated on a list of numpy columns, so one
+# evaluation covers every CPU/domain/task at once. In the vectorized form
+# "x if c else y" becomes where(c, x, y) and the boolean operators become
+# their element-wise counterparts; both branches are computed, so division
+# by zero inside a discarded branch is silenced.
+#
+# Expressions may use 'nan' to mark an undefined value (eg. a zero
+# denominator); format_values() renders it as "-1".
+
+import ast
+import math
+import threading
+
+# Filled once per version, possibly from the summary threads of
+# schedstat_parser
+schema_metrics_cache = {}
+schema_metrics_lock = threading.Lock()
+
+class VectorizeTransformer(ast.NodeTransformer):
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return ast.Call(func=ast.Name(id='where', ctx=ast.Load()),
+                        args=[node.test, node.body, node.orelse], keywords=[])
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        func = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+        expr = node.values[0]
+        for v in node.values[1:]:
+            expr = ast.Call(func=ast.Name(id=func, ctx=ast.Load()), args=[expr, v], keywords=[])
+        return expr
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.Call(func=ast.Name(id='logical_not', ctx=ast.Load()), args=[node.operand], keywords=[])
+        return node
+
+def get_vector_globals():
+    import numpy as np
+
+    return {
+        '__builtins__' : {},
+        'where'        : np.where,
+        'logical_and'  : np.logical_and,
+        'logical_or'   : np.logical_or,
+        'logical_not'  : np.logical_not,
+        'abs'          : np.abs,
+        'min'          : np.minimum,
+        'max'          : np.maximum,
+        'nan'          : np.nan,
+    }
+
+class DerivedMetric:
+    def __init__(self, key, function, values, fmt=None, dtype='float', defaults=None):
+        self.key = key
+        self.function = function
+        self.values = list(values)
+        self.fmt = fmt
+        self.dtype = dtype
+        self.defaults = defaults if defaults else {}
+
+        self.code = compile(function, '<derived:' + key + '>', 'eval')
+
+        tree = ast.parse(function, mode='eval')
+        tree = ast.fix_missing_locations(VectorizeTransformer().visit(tree))
+        self.vector_code = compile(tree, '<derived-vector:' + key + '>', 'eval')
+        self.vector_globals = None
+
+    def __repr__(self):
+        return self.key
+
+    def eval(self, a):
+        return eval(self.code, {'nan': math.nan}, {'a': a})
+
+    def eval_columns(self, columns):
+        import numpy as np
+
+        if self.vector_globals is None:
+            self.vector_globals = get_vector_globals()
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            v = eval(self.vector_code, self.vector_globals, {'a': columns})
+
+        v = np.asarray(v)
+        if columns and v.shape != np.shape(columns[0]):
+            v = np.broadcast_to(v, np.shape(columns[0]))
+
+        return v
+
+def compile_metrics(entries):
+    metrics = {}
+
+    for k in entries:
+        if k.get('is_derived', 1) == 0:
+            continue
+
+        metrics[k['key']] = DerivedMetric(k['key'], k['function'], k['values'], k.get('format'),
+                                          k.get('dtype', 'float'), k.get('defaults'))
+
+    return metrics
+
+def get_schema_metrics(version, keys_ver_map):
+    # Compiled once per schedstat version and section (cpu_keys/domain_keys)
+    if version in schema_metrics_cache:
+        return schema_metrics_cache[version]
+
+    with schema_metrics_lock:
+        if version not in schema_metrics_cache:
+            schema_metrics_cache[version] = {
+                'cpu_keys'    : compile_metrics(keys_ver_map['cpu_keys']),
+                'domain_keys' : compile_metrics(keys_ver_map['domain_keys']),
+            }
+
+        return schema_metrics_cache[version]
+
+def format_values(values, fmt=None):
+    out = []
+
+    for v in values:
+        if isinstance(v, float) and math.isnan(v):
+            out.append("-1")
+        elif fmt:
+            out.append(fmt % v)
+        else:
+            out.append(str(v))
+
+    return out
+
+def update_records(records, metrics):
+    # Evaluate every metric over all the records (dicts of string values)
+    # that carry its inputs and store the formatted result back in them.
+    import numpy as np
+
+    record_list = list(records)
+
+    for metric in metrics.values():
+        required = [v for v in metric.values if v not in metric.defaults]
+        selected = [r for r in record_list if all(v in r for v in required)]
+        if not selected:
+            continue
+
+        conv = int if metric.dtype == 'int' else float
+        dtype = np.int64 if metric.dtype == 'int' else np.float64
+        columns = []
+
+        for v in metric.values:
+            default = metric.defaults.get(v)
+            columns.append(np.array([conv(r[v]) if v in r else default for r in selected], dtype=dtype))
+
+        results = format_values(metric.eval_columns(columns).tolist(), metric.fmt)
+        for r, value in zip(selected, results):
+            r[metric.key] = value
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Per phase profile of the post-processing scripts (--profile).
+#
+# A phase (read, parse, diff, derive, render, write) records its wall time,
+# the CPU time of the process, the peak RSS of the process when it ends and
+# the item counts (lines, cpus, tasks...) the caller sets on it. A phase
+# entered several times, eg. once per task, accumulates. The profile is
+# written as <dir>/<tool>.profile.json.
+
+import os
+import json
+import time
+import resource
+import contextlib
+
+class PhaseProfile:
+    def __init__(self, tool, enabled=True):
+        self.tool = tool
+        self.enabled = enabled
+        self.phases = {}
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def phase(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext({})
+
+        return self.record(name)
+
+    @contextlib.contextmanager
+    def record(self, name):
+        counts = {}
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield counts
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+
+            p = self.phases.setdefault(name, {'wall_time': 0.0, 'cpu_time': 0.0, 'calls': 0, 'counts': {}})
+            p['wall_time'] += wall_time
+            p['cpu_time'] += cpu_time
+            p['calls'] += 1
+            p['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            for k, v in counts.items():
+                p['counts'][k] = p['counts'].get(k, 0) + v
+
+    def write(self, dir_path):
+        if not self.enabled:
+            return None
+
+        profile = {
+            'tool'        : self.tool,
+            'wall_time'   : time.perf_counter() - self.wall_start,
+            'cpu_time'    : time.process_time() - self.cpu_start,
+            'peak_rss_kb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'phases'      : [dict(phase=name, **p) for name, p in self.phases.items()],
+        }
+
+        profile_path = os.path.join(dir_path, self.tool + '.profile.json')
+        with open(profile_path, 'w') as profile_file:
+            json.dump(profile, profile_file, indent=4)
+
+        return profile_path
+
+disabled = PhaseProfile(None, False)
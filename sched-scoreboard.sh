@@ -19,6 +19,10 @@ MIGRATION_STATS_ENABLE=0
 
 DEPARTED_TASKS_ONLY=0
 RQLEN_PROFILE_TIME=100
+SCHEDSTAT_INTERVAL=0
+SCHEDSTAT_BINARY=0
+BPFTRACE_FORMAT=""
+PROFILE_FLAG=""
 
 DEFAULT_MAX_PIDS=65536
 BPF_NEEDED=1
@@ -65,6 +69,23 @@ while [[ $# -gt 0 ]]; do
             shift
             shift
             ;;
+        -s | --schedstat-interval)
+            SCHEDSTAT_INTERVAL="$2"
+            shift
+            shift
+            ;;
+        -B | --schedstat-binary)
+            SCHEDSTAT_BINARY=1
+            shift
+            ;;
+        -J | --bpftrace-json)
+            BPFTRACE_FORMAT="-f json"
+            shift
+            ;;
+        -P | --profile)
+            PROFILE_FLAG="--profile"
+            shift
+            ;;
         -W | --workload)
             shift
             POSITIONAL_ARGS=$@ # save positional arg
@@ -83,6 +104,10 @@ while [[ $# -gt 0 ]]; do
             echo " -d | --departed-tasks       : Generate report for only those tasks that exited during monitoring period (Default complete report)"
             echo " -t | --rqlen-profile-time   : Time in ms for capturing of runq length (Default 100 ms)"
             echo " -p | --max-pids             : Maximum number of PIDs that may be active during the period of monitoring (Default $DEFAULT_MAX_PIDS)"
+            echo " -s | --schedstat-interval   : Also snapshot /proc/schedstat every given seconds into a timeline (Default disabled)"
+            echo " -B | --schedstat-binary     : Store the schedstat snapshots in the compact binary format (Default text)"
+            echo " -J | --bpftrace-json        : Write the per-task and migration bpftrace outputs as JSON (Default text)"
+            echo " -P | --profile              : Write the per phase cost of the post-processing scripts to <script>.profile.json in the logdir"
             echo " -W | --workload             : Workload"
             exit 1
             ;;
@@ -123,13 +148,64 @@ TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
 echo "[$TIMESTAMP] Snapshotting schedstats before..."
 old_schedstats=`cat /proc/sys/kernel/sched_schedstats`
 echo 1 > /proc/sys/kernel/sched_schedstats
-cat /proc/schedstat > $LOGDIR/schedstat-before
+
+SCHEDSTAT_BEFORE=$LOGDIR/schedstat-before
+SCHEDSTAT_AFTER=$LOGDIR/schedstat-after
+SCHEDSTAT_TIMELINE=$LOGDIR/schedstat-timeline
+if [ $SCHEDSTAT_BINARY == 1 ]
+then
+    SCHEDSTAT_BEFORE=$SCHEDSTAT_BEFORE.bin
+    SCHEDSTAT_AFTER=$SCHEDSTAT_AFTER.bin
+    SCHEDSTAT_TIMELINE=$SCHEDSTAT_TIMELINE.bin
+fi
+
+function schedstat_snapshot () {
+    if [ $SCHEDSTAT_BINARY == 1 ]
+    then
+        python3 $SCRIPTDIR/schedstat_binary.py -o $1
+    else
+        cat /proc/schedstat > $1
+    fi
+}
+
+schedstat_snapshot $SCHEDSTAT_BEFORE
+
+function schedstat_timeline_snapshot () {
+    if [ $SCHEDSTAT_BINARY == 1 ]
+    then
+        python3 $SCRIPTDIR/schedstat_binary.py -a -o $SCHEDSTAT_TIMELINE
+    else
+        { echo "snapshot `date +%s.%N`"; cat /proc/schedstat; } >> $SCHEDSTAT_TIMELINE
+    fi
+}
+
+function schedstat_timeline_loop () {
+    trap 'exit 0' SIGTERM
+    while true
+    do
+        schedstat_timeline_snapshot
+        sleep $SCHEDSTAT_INTERVAL &
+        wait $!
+    done
+}
+
+if [ "$SCHEDSTAT_INTERVAL" != "0" ]
+then
+    TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
+    echo "[$TIMESTAMP] Beginning schedstat timeline (Period $SCHEDSTAT_INTERVAL s)..."
+    if [ $SCHEDSTAT_BINARY == 1 ]
+    then
+        python3 $SCRIPTDIR/schedstat_binary.py -o $SCHEDSTAT_TIMELINE -p $SCHEDSTAT_INTERVAL&
+    else
+        schedstat_timeline_loop&
+    fi
+    SCHEDSTAT_TIMELINE_PID=$!
+fi
 
 if  [ $TASK_STATS_DISABLE == 0 ]
 then
     TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
     echo "[$TIMESTAMP] Snapshotting taskstats before..."
-    mkdir $LOGDIR/taskstat-before
     $SCRIPTDIR/capture_taskstat.py $LOGDIR/taskstat-before
 fi
 
@@ -192,7 +268,7 @@ then
             echo "[$TIMESTAMP] Beginning profiling of tasks..."
             python3 $SCRIPTDIR/generate_pertask_bpftrace.py $SCRIPTDIR
 	    cp $SCRIPTDIR/taskstat_fields.py $LOGDIR/taskstat_fields.py
-            $SCRIPTDIR/bpftrace $SCRIPTDIR/sched-pertask-stat.bt -o $LOGDIR/pertask.bpftrace.output&
+            $SCRIPTDIR/bpftrace $BPFTRACE_FORMAT $SCRIPTDIR/sched-pertask-stat.bt -o $LOGDIR/pertask.bpftrace.output&
         fi
     fi
 
@@ -209,7 +285,7 @@ then
     then
         TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
         echo "[$TIMESTAMP] Beginning profiling of task migration..."
-        $SCRIPTDIR/bpftrace $SCRIPTDIR/sched-category-full.bt -o $LOGDIR/sched-category.bpftrace.output&
+        $SCRIPTDIR/bpftrace $BPFTRACE_FORMAT $SCRIPTDIR/sched-category-full.bt -o $LOGDIR/sched-category.bpftrace.output&
     fi
 fi
 
@@ -226,11 +302,19 @@ $command&
 COMMAND_PID=$!
 wait $COMMAND_PID
 
+if [ "$SCHEDSTAT_INTERVAL" != "0" ]
+then
+    TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
+    echo "[$TIMESTAMP] Stopping schedstat timeline"
+    kill $SCHEDSTAT_TIMELINE_PID
+    wait $SCHEDSTAT_TIMELINE_PID
+    schedstat_timeline_snapshot
+fi
+
 if [ $TASK_STATS_DISABLE == 0 ]
 then
     TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
     echo "[$TIMESTAMP] Snapshotting taskstats after..."
-    mkdir $LOGDIR/taskstat-after
     $SCRIPTDIR/capture_taskstat.py $LOGDIR/taskstat-after
 fi
 
@@ -243,7 +327,7 @@ fi
 
 TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
 echo "[$TIMESTAMP] Snapshotting schedstats after..."
-cat /proc/schedstat > $LOGDIR/schedstat-after
+schedstat_snapshot $SCHEDSTAT_AFTER
 echo $old_schedstats > /proc/sys/kernel/sched_schedstats
 wait
 
@@ -251,19 +335,19 @@ if [ $MIGRATION_STATS_ENABLE == 1 ]
 then
     TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
     echo "[$TIMESTAMP] Generating migrate tasks report..."
-    python3 $SCRIPTDIR/sched_taskstats_parser.py -d $LOGDIR > $LOGDIR/tasks-summary.log
+    python3 $SCRIPTDIR/sched_taskstats_parser.py -d $LOGDIR $PROFILE_FLAG > $LOGDIR/tasks-summary.log
 fi
 
 if [ $TASK_STATS_DISABLE == 0 ]
 then
     TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
     echo "[$TIMESTAMP] Generating taskstats report..."
-    python3 $SCRIPTDIR/sched_pertask_parser.py -d $LOGDIR
+    python3 $SCRIPTDIR/sched_pertask_parser.py -d $LOGDIR $PROFILE_FLAG
     if [ $DEPARTED_TASKS_ONLY == 1 ]
     then
-        python3 $SCRIPTDIR/sched_pertask_report.py -d $LOGDIR -D
+        python3 $SCRIPTDIR/sched_pertask_report.py -d $LOGDIR -D $PROFILE_FLAG
     else
-        python3 $SCRIPTDIR/sched_pertask_report.py -d $LOGDIR
+        python3 $SCRIPTDIR/sched_pertask_report.py -d $LOGDIR $PROFILE_FLAG
     fi
 fi
 
@@ -271,9 +355,21 @@ TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
 echo "[$TIMESTAMP] Computing schedstats summary..."
 if [ -f $LOGDIR/domain_map.cfg ]
 then
-    python3 $SCRIPTDIR/schedstat_parser.py -b $LOGDIR/schedstat-before -a $LOGDIR/schedstat-after  -d $LOGDIR/domain_map.cfg  -o $LOGDIR/schedstat-summary
+    python3 $SCRIPTDIR/schedstat_parser.py -b $SCHEDSTAT_BEFORE -a $SCHEDSTAT_AFTER  -d $LOGDIR/domain_map.cfg  -o $LOGDIR/schedstat-summary -T $LOGDIR/schedstat-topology $PROFILE_FLAG
 else
-    python3 $SCRIPTDIR/schedstat_parser.py -b $LOGDIR/schedstat-before -a $LOGDIR/schedstat-after -o $LOGDIR/schedstat-summary
+    python3 $SCRIPTDIR/schedstat_parser.py -b $SCHEDSTAT_BEFORE -a $SCHEDSTAT_AFTER -o $LOGDIR/schedstat-summary -T $LOGDIR/schedstat-topology $PROFILE_FLAG
+fi
+
+if [ "$SCHEDSTAT_INTERVAL" != "0" ]
+then
+    TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
+    echo "[$TIMESTAMP] Computing schedstat timeline..."
+    if [ -f $LOGDIR/domain_map.cfg ]
+    then
+        python3 $SCRIPTDIR/schedstat_timeline.py -t $SCHEDSTAT_TIMELINE -d $LOGDIR/domain_map.cfg -o $LOGDIR/schedstat-timeline-summary
+    else
+        python3 $SCRIPTDIR/schedstat_timeline.py -t $SCHEDSTAT_TIMELINE -o $LOGDIR/schedstat-timeline-summary
+    fi
 fi
 
 TIMESTAMP=`date +%Y-%m-%d\ %H:%M:%S`
@@ -1,6 +1,10 @@
 #!/usr/bin/python3
 import os
 import sys
+import derived_metrics
+import bpftrace_output
+import phase_profile
+import taskstat_archive
 from optparse import OptionParser
 
 stats_map = {
@@ -55,20 +59,29 @@ stats_map = {
     "total_numa_faults"           :"count",
 }
 
-def compute_nr_switches(voluntary_switches, involuntary_switches):
-    return int(voluntary_switches) + int(involuntary_switches)
-
-def compute_avg_atom(sum_exec_runtime, nr_switches):
-    switches = int(nr_switches)
-    if switches == 0:
-        return "-1"
-    return "%1.6f" %(float(sum_exec_runtime)/switches)
-
-def compute_avg_per_cpu(sum_exec_runtime, nr_migrations):
-    migrations = int(nr_migrations)
-    if migrations == 0:
-        return "-1"
-    return "%1.6f" %(float(sum_exec_runtime)/migrations)
+derived_stats_list = [
+    {
+        "key"      : "nr_switches",
+        "function" : "a[0] + a[1]",
+        "values"   : ["nr_voluntary_switches", "nr_involuntary_switches"],
+        "dtype"    : "int",
+    },
+    {
+        "key"      : "avg_atom",
+        "function" : "nan if a[1] == 0 else a[0] / a[1]",
+        "values"   : ["sum_exec_runtime", "nr_switches"],
+        "defaults" : {"nr_switches": 0},
+        "format"   : "%1.6f",
+    },
+    {
+        "key"      : "avg_per_cpu",
+        "function" : "nan if a[1] == 0 else a[0] / a[1]",
+        "values"   : ["sum_exec_runtime", "nr_migrations"],
+        "format"   : "%1.6f",
+    },
+]
+
+derived_metrics_map = derived_metrics.compile_metrics(derived_stats_list)
 
 derived_stats_map = {
     "nr_switches"  :"count",
@@ -84,95 +97,80 @@ class Task:
         self.info = {}
         self.stats = {}
 
-def split_line(s):
-    stripped_s = s.strip()
-    map_key_start_index = stripped_s.strip().index('[')
-    map_key_end_index = stripped_s.index(']')
-    map_value_start_index = stripped_s.index(':')
-
-    key = stripped_s[:map_key_start_index].replace('@', '')
-    taskpid = stripped_s[map_key_start_index + 1: map_key_end_index].strip()
-    value = stripped_s[map_value_start_index + 1:].strip()
-
-    return (key, taskpid, value)
-
 def get_task(taskpid):
     if taskpid not in tasks:
         tasks[taskpid] = Task(taskpid);
     return tasks[taskpid]
 
-def parse_data(lines):
-    for line in lines:
-        if "Attaching" in line:
+def parse_data(records):
+    count = 0
+    for (key, keys, value) in records:
+        count += 1
+        if not keys:
             continue
-        elif "@" in line:
-            (key, taskpid, value) = split_line(line)
-            tasks[taskpid] = get_task(taskpid)
-            if key == "comm":
-                tasks[taskpid].info[key] = value
-            else:
-                tasks[taskpid].stats[key] = value
-
-def update_derived_stats():
-    for taskpid, task in tasks.items():
-        nr_switches_value = 0
-        if 'nr_voluntary_switches' in task.stats and 'nr_involuntary_switches' in task.stats:
-            voluntary_switches = task.stats['nr_voluntary_switches']
-            involuntary_switches = task.stats['nr_involuntary_switches']
-            nr_switches_value = compute_nr_switches(voluntary_switches, involuntary_switches)
-            task.stats.update({"nr_switches": str(nr_switches_value)})
+        taskpid = keys[0]
+        task = get_task(taskpid)
+        if key == "comm":
+            task.info[key] = str(value)
+        else:
+            task.stats[key] = value
 
-        if 'sum_exec_runtime' in task.stats:
-            sum_exec_runtime = task.stats['sum_exec_runtime']
+    return count
 
-            avg_atom = compute_avg_atom(sum_exec_runtime, nr_switches_value)
-            task.stats.update({"avg_atom": avg_atom})
+def update_derived_stats():
+    derived_metrics.update_records([task.stats for task in tasks.values()], derived_metrics_map)
 
-            if 'nr_migrations' in task.stats:
-                nr_migrations = task.stats['nr_migrations']
-                avg_per_cpu = compute_avg_per_cpu(sum_exec_runtime, nr_migrations)
-                task.stats.update({"avg_per_cpu": avg_per_cpu})
+def get_output_fields():
+    # stat -> (line format, unit is ms) of every stat written to the
+    # workload archive, resolved once instead of per task
+    import taskstat_fields
+    fields = {}
+    for stat, name in taskstat_fields.stats_map.items():
+        unit = stats_map.get(stat, derived_stats_map.get(stat, ""))
+        fields[stat] = ("%-47s:" %(name.replace("%", "%%")) + "%21s\n", unit == "ms")
+    return fields
 
 def print_data(taskstat_workload_path):
-    import taskstat_fields
-    for taskpid, task in tasks.items():
-        output_file = taskstat_workload_path +"/"+ taskpid
-        fout = open(output_file, "w")
-        fout.write("%s %s\n" %(task.info["comm"], taskpid))
-        fout.write("-------------------------------------------------------------------\n")
-        for stat, value in task.stats.items():
-            if stat in taskstat_fields.stats_map.keys():
-                name = taskstat_fields.stats_map[stat]
-                unit = ""
-                if stat in stats_map.keys():
-                    unit = stats_map[stat]
-                elif stat in derived_stats_map.keys():
-                    unit = derived_stats_map[stat]
-                if unit == "ms":
-                    pvalue = str(float(value) / 1000000)
-                else:
-                    pvalue = value
-                fout.write("%-47s:%21s\n" %(name, pvalue))
-        fout.close()
+    fields = get_output_fields()
+    with taskstat_archive.TaskStatWriter(taskstat_workload_path) as archive:
+        for taskpid, task in tasks.items():
+            out = ["%s %s\n" %(task.info["comm"], taskpid)]
+            out.append("-------------------------------------------------------------------\n")
+            for stat, value in task.stats.items():
+                field = fields.get(stat)
+                if field is None:
+                    continue
+                (fmt, ms) = field
+                if ms:
+                    value = str(float(value) / 1000000)
+                out.append(fmt %(value))
+            archive.append(taskpid, "".join(out))
 
 if __name__ == "__main__":
     parser = OptionParser()
     parser.add_option("-d", "--logdir", dest="log_dir", type=str, help="path to logdir")
+    parser.add_option("-P", "--profile", dest="profile", action="store_true", default=False, help="Write the time, CPU time, peak RSS and item counts of every phase to sched_pertask_parser.profile.json in the logdir")
 
     (options, args) = parser.parse_args()
 
     logdir = options.log_dir
+    prof = phase_profile.PhaseProfile('sched_pertask_parser', options.profile)
 
     sys.path.insert(0, logdir)
 
-    bpftrace_output_path = os.path.join(logdir, "pertask.bpftrace.output")
-    fin = open(bpftrace_output_path, "r")
-    lines = fin.readlines()
-    fin.close
-
     taskstat_workload_path = os.path.join(logdir, "taskstat-workload")
-    os.makedirs(taskstat_workload_path, exist_ok = True)
 
-    parse_data(lines)
-    update_derived_stats()
-    print_data(taskstat_workload_path)
+    with prof.phase('parse') as counts:
+        bpftrace_output_path = os.path.join(logdir, "pertask.bpftrace.output")
+        counts['records'] = parse_data(bpftrace_output.read_maps(bpftrace_output_path, raw=["comm"]))
+        counts['tasks'] = len(tasks)
+
+    with prof.phase('derive') as counts:
+        update_derived_stats()
+        counts['tasks'] = len(tasks)
+
+    with prof.phase('write') as counts:
+        print_data(taskstat_workload_path)
+        counts['tasks'] = len(tasks)
+
+    prof.write(logdir)
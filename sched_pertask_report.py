@@ -2,7 +2,11 @@
 import os
 import sys
 import json
+import concurrent.futures
+import derived_metrics
+import phase_profile
 import sched_taskstats_parser
+import taskstat_archive
 from optparse import OptionParser
 
 stats_map = {
@@ -61,23 +65,26 @@ stats_map = {
     "total_numa_faults"              :"diff"
 }
 
-def compute_sum_idle_runtime(sum_sleep_runtime, sum_block_runtime):
-    sum_block_runtime_value = float(sum_block_runtime)
-    if sum_block_runtime_value == 0.0:
-        return "-1"
-    return str(float(sum_sleep_runtime)/sum_block_runtime_value)
-
-def compute_avg_idle_runtime(sum_idle_runtime, nr_voluntary_switches):
-    nr_voluntary_switches_value = float(nr_voluntary_switches)
-    if nr_voluntary_switches_value == 0:
-        return "-1"
-    return str(float(sum_idle_runtime)/nr_voluntary_switches_value)
-
-def compute_avg_wait_time(wait_sum, wait_count):
-    wait_count_value = float(wait_count)
-    if wait_count_value == 0.0:
-        return "-1"
-    return str(float(wait_sum)/wait_count_value)
+derived_stats_list = [
+    {
+        "key"      : "sum_idle_runtime",
+        "function" : "nan if a[1] == 0 else a[0] / a[1]",
+        "values"   : ["sum_sleep_runtime", "sum_block_runtime"],
+    },
+    # sum_idle_runtime is taken as -1 when there is no block time
+    {
+        "key"      : "avg_idle_runtime",
+        "function" : "nan if a[2] == 0 else (-1 if a[1] == 0 else a[0] / a[1]) / a[2]",
+        "values"   : ["sum_sleep_runtime", "sum_block_runtime", "nr_voluntary_switches"],
+    },
+    {
+        "key"      : "avg_wait_time",
+        "function" : "nan if a[1] == 0 else a[0] / a[1]",
+        "values"   : ["wait_sum", "wait_count"],
+    },
+]
+
+derived_metrics_map = derived_metrics.compile_metrics(derived_stats_list)
 
 class Task:
     def __init__(self, taskpid, comm):
@@ -102,51 +109,60 @@ def split_line(line):
     value = first_split[1].strip()
     return (key, value)
 
+# Line key -> the first taskstat_fields.stats_map key it ends with (None
+# when there is none), resolved once per distinct line key
+field_keys = {}
+
+def get_field(key):
+    field = field_keys.get(key, False)
+    if field is False:
+        import taskstat_fields
+        field = next((stat_key for stat_key in taskstat_fields.stats_map.keys() if key.endswith(stat_key)), None)
+        field_keys[key] = field
+
+    return field
+
 def parse_data(lines):
-    import taskstat_fields
     stats = {}
     for line in lines:
         if ":" in line:
             (key, value) = split_line(line)
-            for stat_key in taskstat_fields.stats_map.keys():
-                if key.endswith(stat_key):
-                    stats[stat_key] = value
-                    break
+            stat_key = get_field(key)
+            if stat_key is not None:
+                stats[stat_key] = value
 
     return stats
 
 def update_derived_stats(tasks):
-    for taskpid, task in tasks.items():
-        if 'sum_sleep_runtime' in task.stats and 'sum_block_runtime' in task.stats:
-            sum_sleep_runtime = task.stats['sum_sleep_runtime']
-            sum_block_runtime = task.stats['sum_block_runtime']
-            sum_idle_runtime = compute_sum_idle_runtime(sum_sleep_runtime, sum_block_runtime)
-            task.stats.update({'sum_idle_runtime': sum_idle_runtime})
-            if 'nr_voluntary_switches' in task.stats:
-                nr_voluntary_switches = task.stats['nr_voluntary_switches']
-                avg_idle_runtime = compute_avg_idle_runtime(sum_idle_runtime,  nr_voluntary_switches)
-                task.stats.update({'avg_idle_runtime': avg_idle_runtime})
-        if 'wait_sum' in task.stats and 'wait_count' in task.stats:
-            wait_sum = task.stats['wait_sum']
-            wait_count = task.stats['wait_count']
-            avg_wait_time = compute_avg_wait_time(wait_sum, wait_count)
-            task.stats.update({'avg_wait_time': avg_wait_time})
-
-def updateTaskReport(taskpid, fin1, fin2 = None):
-    line1 = fin1.readline()
-    comm = line1.split()[0]
-    lines1 = fin1.readlines()[0:]
-
-    task = Task(taskpid, comm)
-    task.stats = parse_data(lines1)
-
-    if fin2 != None:
-        lines2 = fin2.readlines()[1:]
-        stats2 = parse_data(lines2)
-        for key, value in stats2.items():
-            if key in stats_map:
-                pvalue = func_map[stats_map[key]](task.stats[key], value)
-                task.stats.update({key: pvalue})
+    derived_metrics.update_records([task.stats for task in tasks.values()], derived_metrics_map)
+
+def read_lines(archive, taskpid):
+    with prof.phase('read') as counts:
+        lines = archive.read_lines(taskpid)
+        counts['files'] = 1
+        counts['lines'] = len(lines)
+
+    return lines
+
+def updateTaskReport(taskpid, lines1, lines2 = None):
+    with prof.phase('parse') as counts:
+        comm = lines1[0].split()[0]
+
+        task = Task(taskpid, comm)
+        task.stats = parse_data(lines1[1:])
+
+        stats2 = None
+        if lines2 != None:
+            stats2 = parse_data(lines2[1:])
+        counts['tasks'] = 1
+
+    if stats2 != None:
+        with prof.phase('diff') as counts:
+            for key, value in stats2.items():
+                if key in stats_map:
+                    pvalue = func_map[stats_map[key]](task.stats[key], value)
+                    task.stats.update({key: pvalue})
+            counts['tasks'] = 1
 
     return task
 
@@ -156,6 +172,98 @@ func_map = {
     "diff"  :   diff
 }
 
+prof = phase_profile.disabled
+
+def plan_tasks(before, workload, after):
+    # Join the three snapshot sets on tid, in one pass over each. A task
+    # seen before the workload is paired with its after snapshot, else with
+    # its workload one; the tasks left are reported from their only
+    # snapshot. Returns the (tid, phase, second phase or None) reports in
+    # output order and the workload tids left unpaired.
+    workload_tids = dict.fromkeys(workload.tids())
+    after_tids = dict.fromkeys(after.tids())
+    plan = []
+
+    for tid in before.tids():
+        if tid in after_tids:
+            plan.append((tid, "taskstat-before", "taskstat-after"))
+            del after_tids[tid]
+        elif tid in workload_tids:
+            plan.append((tid, "taskstat-before", "taskstat-workload"))
+            del workload_tids[tid]
+        else:
+            plan.append((tid, "taskstat-before", None))
+
+    plan += [(tid, "taskstat-workload", None) for tid in workload_tids]
+    plan += [(tid, "taskstat-after", None) for tid in after_tids]
+
+    return (plan, workload_tids)
+
+def report_tasks(plan, archives):
+    tasks = []
+    for (tid, phase1, phase2) in plan:
+        lines1 = read_lines(archives[phase1], tid)
+        lines2 = None
+        if phase2 is not None:
+            lines2 = read_lines(archives[phase2], tid)
+        tasks.append(updateTaskReport(tid, lines1, lines2))
+
+    return tasks
+
+def report_shard(shard):
+    # In a worker process: the reports of a run of tids, with their derived
+    # stats, as (tid, comm, stats) tuples which are cheaper to send back.
+    # The phases of a worker are not profiled.
+    global prof
+    prof = phase_profile.disabled
+
+    (plan, archives) = shard
+    tasks = report_tasks(plan, archives)
+    update_derived_stats({task.taskpid: task for task in tasks})
+
+    return [(task.taskpid, task.comm, task.stats) for task in tasks]
+
+def merge_tasks(archives, jobs=1):
+    # With more than one job, the plan is cut in jobs * 4 runs of contiguous
+    # tids, each one reported by a worker process from its own shard of the
+    # archives. The runs are put back in plan order, so the output is the
+    # same as with a single job. Returns the tasks, derived stats included,
+    # and the workload tids left unpaired.
+    (plan, departed) = plan_tasks(archives["taskstat-before"], archives["taskstat-workload"], archives["taskstat-after"])
+    tasks = {}
+
+    if jobs <= 1 or len(plan) < 2:
+        for task in report_tasks(plan, archives):
+            tasks[task.taskpid] = task
+
+        with prof.phase('derive') as counts:
+            update_derived_stats(tasks)
+            counts['tasks'] = len(tasks)
+
+        return (tasks, departed)
+
+    with prof.phase('report') as counts:
+        nshards = min(len(plan), jobs * 4)
+        bounds = [int(c * len(plan) / nshards) for c in range(nshards + 1)]
+        shards = []
+        for c in range(nshards):
+            shard_plan = plan[bounds[c]:bounds[c + 1]]
+            shard_archives = {}
+            for phase, archive in archives.items():
+                tids = [p[0] for p in shard_plan if phase in p[1:]]
+                shard_archives[phase] = archive.get_shard(tids)
+            shards.append((shard_plan, shard_archives))
+
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            for shard_tasks in pool.map(report_shard, shards):
+                for (taskpid, comm, stats) in shard_tasks:
+                    task = Task(taskpid, comm)
+                    task.stats = stats
+                    tasks[taskpid] = task
+        counts['tasks'] = len(tasks)
+
+    return (tasks, departed)
+
 def append_migrations_counts(tasks, fin_migrations):
     keys = []
     migrations = {}
@@ -217,55 +325,43 @@ if __name__ == "__main__":
     parser = OptionParser()
     parser.add_option("-d", "--logdir", dest="log_dir", type=str, help="path to logdir")
     parser.add_option("-D", "--departed-tasks", dest="departed_tasks", action="store_true", default=False, help="Generate report for only those tasks that exited during monitoring  period (Default complete report)")
+    parser.add_option("-j", "--jobs", dest="jobs", type=int, default=1, help="Number of worker processes the per-task reports are computed by. Default: 1")
+    parser.add_option("-P", "--profile", dest="profile", action="store_true", default=False, help="Write the time, CPU time, peak RSS and item counts of every phase to sched_pertask_report.profile.json in the logdir")
 
     (options, args) = parser.parse_args()
 
     logdir = options.log_dir
-    taskstat_before = os.listdir(logdir+"/taskstat-before")
-    taskstat_workload = os.listdir(logdir+"/taskstat-workload")
-    taskstat_after = os.listdir(logdir+"/taskstat-after")
+    prof = phase_profile.PhaseProfile('sched_pertask_report', options.profile)
+
+    with prof.phase('read'):
+        archives = {}
+        for phase in ["taskstat-before", "taskstat-workload", "taskstat-after"]:
+            archives[phase] = taskstat_archive.TaskStatArchive(os.path.join(logdir, phase))
+            if archives[phase].load() < 0:
+                exit(1)
 
     sys.path.insert(0, logdir)
 
-    taskstat_workload_copy = taskstat_workload
-    tasks = {}
+    (tasks, taskstat_workload_copy) = merge_tasks(archives, options.jobs)
 
-    for file in taskstat_before:
-        fin1 = open(os.path.join(logdir, "taskstat-before", file), "r")
-        fin2 = None
-        if file in taskstat_after:
-            fin2 = open(os.path.join(logdir, "taskstat-after", file), "r")
-            taskstat_after.remove(file)
-        elif file in taskstat_workload:
-            fin2 = open(os.path.join(logdir, "taskstat-workload", file), "r")
-            taskstat_workload.remove(file)
-        tasks[file] = updateTaskReport(file, fin1, fin2)
-        fin1.close()
-        if fin2 != None:
-            fin2.close()
-
-    for file in taskstat_workload:
-        fin = open(os.path.join(logdir, "taskstat-workload", file), "r")
-        tasks[file] = updateTaskReport(file, fin)
-        fin.close()
-
-    for file in taskstat_after:
-        fin = open(os.path.join(logdir, "taskstat-after", file), "r")
-        tasks[file] = updateTaskReport(file, fin)
-        fin.close()
-
-    update_derived_stats(tasks)
+    for archive in archives.values():
+        archive.close()
 
     departed_tasks_flag = False
     if options.departed_tasks:
         departed_tasks_flag = True
 
-    if os.path.exists(logdir+"/migrations.csv"):
-        fin_migrations = open(logdir+"/migrations.csv", "r")
-        append_migrations_counts(tasks, fin_migrations)
-        fin_migrations.close()
-    else:
-        sched_taskstats_parser.get_topology(logdir)
+    with prof.phase('derive'):
+        if os.path.exists(logdir+"/migrations.csv"):
+            fin_migrations = open(logdir+"/migrations.csv", "r")
+            append_migrations_counts(tasks, fin_migrations)
+            fin_migrations.close()
+        else:
+            sched_taskstats_parser.get_topology(logdir)
+
+    with prof.phase('write') as counts:
+        update_to_json(tasks, taskstat_workload_copy, departed_tasks_flag)
+        update_to_csv(tasks, taskstat_workload_copy, departed_tasks_flag)
+        counts['tasks'] = len(tasks)
 
-    update_to_json(tasks, taskstat_workload_copy, departed_tasks_flag)
-    update_to_csv(tasks, taskstat_workload_copy, departed_tasks_flag)
+    prof.write(logdir)
@@ -6,8 +6,12 @@
 #          Gautham R Shenoy <gautham.shenoy@amd.com>,
 #          K Prateek Nayak <kprateek.nayak@amd.com>
 
+import io
 import json
 import operator
+import phase_profile
+import schedstat_parser
+import bpftrace_output
 from optparse import OptionParser
 
 topology = {}
@@ -80,50 +84,44 @@ def parse_migration(taskpid, orig_cpu, dest_cpu, is_waking, count):
 
     task.update_migration_count(orig_cpu, dest_cpu, is_waking, count)
 
-def split_line(s):
-    first_split = s.split('[')
-    second_split=first_split[1].split(']')
-    inner_split = second_split[0].split(',')
-    outer_split = second_split[1].split(':')
-
-    taskpid =  inner_split[0].strip()
-    orig_cpu = inner_split[1].strip()
-    dest_cpu  = inner_split[2].strip()
-    is_waking = int(inner_split[3].strip())
-    count = int(outer_split[1].strip())
+def split_line(keys, value):
+    taskpid = keys[0]
+    orig_cpu = keys[1]
+    dest_cpu = keys[2]
+    is_waking = int(keys[3])
+    count = int(value)
 
     return (taskpid, orig_cpu, dest_cpu, is_waking, count)
 
-def split_waking_graph_lines(s):
-    first_split = s.split('[')
-    second_split=first_split[1].split(']')
-    inner_split = second_split[0].split(',')
-    outer_split = second_split[1].split(':')
-
-    waker_name = inner_split[0].strip()
-    waker_pid  = inner_split[1].strip()
+def split_waking_graph_lines(map_name, keys, value):
+    # @waking_pairs[waker pid, wakee pid, waker comm, wakee comm], or
+    # @waking_graph[waker comm, waker pid, wakee comm, wakee pid] in logs
+    # of older versions
+    if map_name == "waking_pairs":
+        waker_pid = keys[0]
+        wakee_pid = keys[1]
+    else:
+        waker_pid = keys[1]
+        wakee_pid = keys[3]
 
-    wakee_name = inner_split[2].strip()
-    wakee_pid  = inner_split[3].strip()
-
-    count = int(outer_split[1].strip())
+    count = int(value)
 
     waker = get_task(waker_pid)
     wakee = get_task(wakee_pid)
 
     return (waker, wakee, count)
 
-def parse_waking_graph(s):
-    (waker, wakee, count) = split_waking_graph_lines(s)
+def parse_waking_graph(map_name, keys, value):
+    (waker, wakee, count) = split_waking_graph_lines(map_name, keys, value)
     waker.wakees[wakee.pid] = count
     wakee.wakers[waker.pid] = count
 
-def parse(s):
-    if "waking_graph" in s:
-        return parse_waking_graph(s)
+def parse(map_name, keys, value):
+    if map_name == "waking_pairs" or map_name == "waking_graph":
+        return parse_waking_graph(map_name, keys, value)
 
-    if "@migrations" in s:
-        (taskpid, orig_cpu, dest_cpu, is_waking, count) = split_line(s)
+    if map_name == "migrations":
+        (taskpid, orig_cpu, dest_cpu, is_waking, count) = split_line(keys, value)
         parse_migration(taskpid, orig_cpu, dest_cpu, is_waking, count)
 
 def intervals_extract(iterable):
@@ -147,8 +145,21 @@ def intervals(cpu_interval_list):
             interval_list.append(str(interval[0])+"-"+str(interval[1]))
     return str(interval_list)
 
+def open_schedstat_before(logdir):
+    # A binary snapshot (-B) is read through its text rendering
+    path = schedstat_parser.get_snapshot_path(logdir, "schedstat-before")
+    if not path.endswith(".bin"):
+        return open(path, "r")
+
+    import schedstat_binary
+    fin = io.StringIO()
+    if schedstat_binary.binary_to_text(path, fin) != 0:
+        exit(1)
+    fin.seek(0)
+    return fin
+
 def get_topology(logdir):
-    fin = open(logdir+"/schedstat-before", "r")
+    fin = open_schedstat_before(logdir)
     fout = open(logdir+"/topology-info", "w")
     fin_domain_map = open(logdir+"/domain_map.cfg", "r")
 
@@ -216,16 +227,16 @@ def get_topology(logdir):
 if __name__ == "__main__":
     parser = OptionParser()
     parser.add_option("-d", "--logdir", dest="log_dir", type=str, help="path to logdir")
+    parser.add_option("-P", "--profile", dest="profile", action="store_true", default=False, help="Write the time, CPU time, peak RSS and item counts of every phase to sched_taskstats_parser.profile.json in the logdir")
 
     (options, args) = parser.parse_args()
 
     logdir=options.log_dir
+    prof = phase_profile.PhaseProfile('sched_taskstats_parser', options.profile)
 
-    f = open(logdir+"/sched-category.bpftrace.output", "r")
-    lines = f.readlines()
-    f.close()
-
-    get_topology(logdir)
+    with prof.phase('topology') as counts:
+        get_topology(logdir)
+        counts['cpus'] = len(topology)
 
     fout = open(logdir+"/migrations.csv", "w")
     migrations_header = "pid ,"
@@ -239,12 +250,21 @@ if __name__ == "__main__":
     migrations_header = migrations_header + wp_header + lb_header
     fout.write(migrations_header + "\n" )
 
-    for line in lines:
-        parse(line)
-
-    for key in sorted(tasks.keys()):
-        task = tasks[key]
-        fout.write(task.print_migration_count() + "\n")
-        task.print_details()
+    with prof.phase('parse') as counts:
+        records = 0
+        for (map_name, keys, value) in bpftrace_output.read_maps(logdir+"/sched-category.bpftrace.output", ["waking_pairs", "waking_graph", "migrations"]):
+            parse(map_name, keys, value)
+            records += 1
+        counts['records'] = records
+        counts['tasks'] = len(tasks)
+
+    with prof.phase('write') as counts:
+        for key in sorted(tasks.keys()):
+            task = tasks[key]
+            fout.write(task.print_migration_count() + "\n")
+            task.print_details()
+        counts['tasks'] = len(tasks)
 
     fout.close()
+
+    prof.write(logdir)
@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Benchmark of the schedstat summary.
+#
+# The summary of a pair of snapshots (given, or generated with
+# schedstat_synth.py) is computed with the node model and with the columnar
+# model, timing every phase separately:
+#
+#   parse     : both snapshots
+#   subtract  : after - before
+#   aggregate : cpuset selection, averages and lb totals
+#   derived   : derived metrics (computed while rendering by the node model)
+#   render    : the text summary, written to memory
+#
+# Times are the best of -n runs. The peak memory allocated by each phase is
+# measured with tracemalloc in a separate run, as tracing slows every
+# allocation down. Both outputs have to be byte-for-byte identical, to each
+# other and to the -R reference when given, otherwise the exit status is 1,
+# so the benchmark can run as a regression job.
+
+import io
+import sys
+import json
+import time
+import resource
+import tempfile
+import tracemalloc
+from optparse import OptionParser
+import schedstat_parser
+import schedstat_synth
+
+phases = ['parse', 'subtract', 'aggregate', 'derived', 'render']
+
+def nodes_phases(before_file, after_file, ctx):
+    desc = ctx.get_system_level_desc()
+    file1_nodes = schedstat_parser.SchedStatNodes('file1')
+    file2_nodes = schedstat_parser.SchedStatNodes('file2')
+
+    if file1_nodes.parse(before_file) != 0 or file2_nodes.parse(after_file) != 0:
+        exit(1)
+    yield 'parse'
+
+    file2_nodes.subtract(file1_nodes)
+    yield 'subtract'
+
+    nodes_to_consider = file2_nodes.select(ctx.cpuset)
+    system_level_node = schedstat_parser.get_nodes_average_node(file2_nodes, nodes_to_consider, desc, ctx)
+    file2_nodes.calculate_node_totals(ctx.cpuset, nodes_to_consider)
+    yield 'aggregate'
+
+    out = io.StringIO()
+    schedstat_parser.write_summary(out, file2_nodes.timestamp - file1_nodes.timestamp, system_level_node, nodes_to_consider, ctx)
+    yield out.getvalue()
+
+def columnar_phases(before_file, after_file, ctx):
+    desc = ctx.get_system_level_desc()
+    file1_matrix = schedstat_parser.load_matrix(before_file, 'file1')
+    file2_matrix = schedstat_parser.load_matrix(after_file, 'file2')
+
+    if file1_matrix is None or file2_matrix is None:
+        exit(1)
+    yield 'parse'
+
+    if file2_matrix.subtract(file1_matrix) != 0:
+        exit(1)
+    yield 'subtract'
+
+    rows = file2_matrix.select(ctx.cpuset)
+    file2_matrix.calculate_node_totals(rows)
+    system_level_node = schedstat_parser.get_matrix_average_node(file2_matrix, rows, desc, ctx)
+    yield 'aggregate'
+
+    file2_matrix.calculate_derived()
+    yield 'derived'
+
+    nodes_to_consider = [schedstat_parser.get_matrix_node(file2_matrix, row) for row in rows]
+    out = io.StringIO()
+    schedstat_parser.write_summary(out, file2_matrix.timestamp, system_level_node, nodes_to_consider, ctx)
+    yield out.getvalue()
+
+def run(model_phases, before_file, after_file, ctx, trace=False):
+    # ({phase: seconds or peak bytes}, output). The last step of the
+    # pipeline is the rendering, which yields the summary text.
+    results = {}
+    output = None
+
+    if trace:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    for step in model_phases(before_file, after_file, ctx):
+        phase = step if step in phases else 'render'
+        if step not in phases:
+            output = step
+
+        if trace:
+            results[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        else:
+            now = time.perf_counter()
+            results[phase] = now - start
+            start = now
+
+    if trace:
+        tracemalloc.stop()
+
+    return (results, output)
+
+def bench(model_phases, before_file, after_file, ctx, repeat, memory=True):
+    times = {}
+    output = None
+
+    for i in range(repeat):
+        (results, output) = run(model_phases, before_file, after_file, ctx)
+        for phase, t in results.items():
+            times[phase] = min(times.get(phase, t), t)
+
+    peak_memory = {}
+    traced_output = output
+    if memory:
+        (peak_memory, traced_output) = run(model_phases, before_file, after_file, ctx, True)
+
+    return {'time': times, 'peak_memory': peak_memory, 'output': output, 'identical': output == traced_output}
+
+def write_results(out, results, label):
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+    schedstat_parser.writen(out, "Benchmark: " + label)
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+    schedstat_parser.writen(out, "%-10s %-10s %14s %14s" %("model", "phase", "time (ms)", "peak (KiB)"))
+
+    for model, r in results.items():
+        for phase in phases + ['total']:
+            if phase == 'total':
+                t = sum(r['time'].values())
+                m = max(r['peak_memory'].values(), default=None)
+            elif phase in r['time']:
+                t = r['time'][phase]
+                m = r['peak_memory'].get(phase)
+            else:
+                continue
+
+            m_str = "%14.1f" %(m / 1024) if m is not None else "%14s" %("-")
+            schedstat_parser.writen(out, "%-10s %-10s %14.2f " %(model, phase, 1000 * t) + m_str)
+
+    schedstat_parser.writen(out, "max rss (KiB) : " + str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("-b", "--before", dest="before_file", type=str, help="schedstat before file. Default: generated")
+    parser.add_option("-a", "--after", dest="after_file", type=str, help="schedstat after file. Default: generated")
+    parser.add_option("-d", "--domainmap", dest="domain_map_file", type=str, help="domain map file")
+    parser.add_option("-l", "--cpulist", dest="cpu_list", type=str, help="list of CPUs to consider. Default: All CPUs")
+    parser.add_option("-v", "--schedstat-version", dest="schedstat_ver", type=int, default=17, help="schedstat version of the generated snapshots. Default: 17")
+    parser.add_option("-c", "--cpus", dest="num_cpus", type=int, default=1024, help="number of CPUs of the generated snapshots. Default: 1024")
+    parser.add_option("-D", "--depth", dest="depth", type=int, default=4, help="number of domain levels of the generated snapshots. Default: 4")
+    parser.add_option("-n", "--repeat", dest="repeat", type=int, default=3, help="number of timed runs of each model. Default: 3")
+    parser.add_option("-N", "--no-memory", dest="memory", action="store_false", default=True, help="skip the (slow) traced run measuring the peak memory of every phase")
+    parser.add_option("-R", "--reference", dest="reference_file", type=str, help="expected summary, compared byte-for-byte with the output of both models")
+    parser.add_option("-S", "--save-reference", dest="save_reference_file", type=str, help="write the node model summary to this file, to be used with -R later")
+    parser.add_option("-x", "--json", dest="json_file", type=str, help="also write the results as JSON to this file")
+
+    (options, args) = parser.parse_args()
+
+    if options.repeat <= 0:
+        print("Error: Need at least one run")
+        exit(1)
+
+    before_file = options.before_file
+    after_file = options.after_file
+    domain_map_file = options.domain_map_file
+    synth_dir = None
+
+    if not before_file or not after_file:
+        if schedstat_parser.get_parse_plan(str(options.schedstat_ver)) is None:
+            exit(1)
+
+        synth_dir = tempfile.TemporaryDirectory(prefix='schedstat-bench-')
+        prefix = synth_dir.name + '/schedstat'
+        synth = schedstat_synth.SchedStatSynth(options.schedstat_ver, options.num_cpus, options.depth)
+        synth.write(prefix)
+        (before_file, after_file) = (prefix + '-before', prefix + '-after')
+        if not domain_map_file:
+            domain_map_file = prefix + '-dmap'
+        label = "synthetic v" + str(options.schedstat_ver) + ", " + str(options.num_cpus) + " cpus, " + str(len(synth.levels)) + " domain levels"
+    else:
+        label = before_file + " " + after_file
+
+    ctx = schedstat_parser.make_context(domain_map_file, options.cpu_list)
+
+    results = {
+        'nodes'    : bench(nodes_phases, before_file, after_file, ctx, options.repeat, options.memory),
+        'columnar' : bench(columnar_phases, before_file, after_file, ctx, options.repeat, options.memory),
+    }
+
+    if synth_dir:
+        synth_dir.cleanup()
+
+    write_results(sys.stdout, results, label)
+
+    expected = results['nodes']['output']
+    if options.reference_file:
+        with open(options.reference_file, 'r') as ref_file:
+            expected = ref_file.read()
+
+    if options.save_reference_file:
+        with open(options.save_reference_file, 'w') as ref_file:
+            ref_file.write(results['nodes']['output'])
+
+    ret = 0
+    for model, r in results.items():
+        if r['output'] != expected or not r['identical']:
+            print('Error: ' + model + ' summary differs from the ' + ('reference' if options.reference_file else 'nodes summary'))
+            ret = 1
+
+    if options.json_file:
+        with open(options.json_file, 'w') as json_file:
+            json.dump({'label': label, 'identical': ret == 0,
+                       'results': {m: {k: r[k] for k in ('time', 'peak_memory')} for m, r in results.items()}}, json_file, indent=2)
+
+    exit(ret)
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Capture /proc/schedstat snapshots in the binary format of
+# SchedStatMatrix.to_binary(), and convert between the binary and the text
+# format. A text input may hold several snapshots (eg. a schedstat
+# timeline), each becomes one binary record and vice versa.
+
+import sys
+import time
+import mmap
+import signal
+from optparse import OptionParser
+import schedstat_matrix
+
+def split_snapshots(lines):
+    # (walltime, lines) for every snapshot of a text schedstat file,
+    # walltime is the <secs> text of the optional "snapshot <secs>" marker
+    # line
+    walltime = None
+    snapshot = []
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+
+        if tokens[0] == 'snapshot' or tokens[0] == 'version':
+            if any(l.startswith('version') for l in snapshot):
+                yield (walltime, snapshot)
+                walltime = None
+                snapshot = []
+
+        if tokens[0] == 'snapshot':
+            walltime = tokens[1]
+        else:
+            snapshot.append(line)
+
+    if snapshot:
+        yield (walltime, snapshot)
+
+def text_to_binary(in_file, out_file_p):
+    with open(in_file, 'r') as sched_file:
+        for (walltime, lines) in split_snapshots(sched_file):
+            matrix = schedstat_matrix.SchedStatMatrix()
+            if matrix.parse_lines(lines) != 0:
+                return -1
+            if walltime is None:
+                out_file_p.write(matrix.to_binary())
+            else:
+                out_file_p.write(matrix.to_binary(float(walltime), walltime))
+
+    return 0
+
+def binary_to_text(in_file, out_file_p):
+    with open(in_file, 'rb') as sched_file:
+        buf = mmap.mmap(sched_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    pos = 0
+    while pos < len(buf):
+        record = schedstat_matrix.get_binary_record(buf, pos)
+        if record is None:
+            print('Error: truncated binary record at offset ', pos)
+            return -1
+
+        matrix = schedstat_matrix.SchedStatMatrix()
+        if matrix.load_binary(buf, pos) != 0:
+            return -1
+
+        if matrix.walltime_text is not None:
+            out_file_p.write('snapshot ' + matrix.walltime_text + '\n')
+        elif record[0] is not None:
+            out_file_p.write('snapshot ' + repr(record[0]) + '\n')
+        matrix.write_text(out_file_p)
+        pos += record[2]
+
+    return 0
+
+def capture(in_file, out_file_p, period):
+    # One record every period seconds until SIGTERM/SIGINT. After the first
+    # one, snapshots are re-read with SchedStatMatrix.refresh().
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    matrix = schedstat_matrix.SchedStatMatrix()
+
+    try:
+        while True:
+            walltime = time.time()
+            with open(in_file, 'rb') as sched_file:
+                data = sched_file.read()
+
+            if matrix.refresh(data) != 0:
+                return -1
+
+            out_file_p.write(matrix.to_binary(walltime))
+            out_file_p.flush()
+
+            if not period:
+                return 0
+
+            time.sleep(period)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("-i", "--in", dest="in_file", type=str, default="/proc/schedstat", help="schedstat file, in the text or the binary format. Default: /proc/schedstat")
+    parser.add_option("-o", "--out", dest="out_file", type=str, help="output file. Binary if the input is text, text if the input is binary")
+    parser.add_option("-a", "--append", dest="append", action="store_true", default=False, help="append to the output file")
+    parser.add_option("-p", "--period", dest="period", type=float, default=0, help="keep capturing one snapshot of the input every given seconds until terminated. Snapshots of /proc/schedstat are stamped with their walltime")
+
+    (options, args) = parser.parse_args()
+
+    if not options.out_file:
+        print("Error: Need an output file")
+        exit(1)
+
+    mode = "a" if options.append or options.period else "w"
+
+    # A snapshot of the live /proc/schedstat is stamped with its walltime,
+    # a single one when there is no period
+    if options.period or options.in_file.startswith("/proc/"):
+        with open(options.out_file, mode + "b") as out_file_p:
+            ret = capture(options.in_file, out_file_p, options.period)
+    elif schedstat_matrix.is_binary(options.in_file):
+        with open(options.out_file, mode) as out_file_p:
+            ret = binary_to_text(options.in_file, out_file_p)
+    else:
+        with open(options.out_file, mode + "b") as out_file_p:
+            ret = text_to_binary(options.in_file, out_file_p)
+
+    if ret != 0:
+        exit(1)
@@ -6,40 +6,27 @@
 #          Gautham R Shenoy <gautham.shenoy@amd.com>,
 #          K Prateek Nayak <kprateek.nayak@amd.com>
 
-import sys
-from optparse import OptionParser
 import os.path
+import concurrent.futures
+from optparse import OptionParser
+import numpy as np
+import schedstat_parser
+import schedstat_stats
 
 comp_help_text = 'pct increase of a schedstat metric of the other run with respect to the corresponding metric of the baseline run is indicating within the |  | pair'
-usage="python3 %prog -b baseline_logdir -c compare_logdir -o out_file [-f baseline_cpu_list] [-s compare_cpu_list]"
-parser = OptionParser(usage)
-parser.add_option("-b", "--basedir", dest="baseline_log_dir", type=str, help="sched-scoreboard log directory of the run that should be considered as the baseline")
-parser.add_option("-c", "--compdir", dest="compare_log_dir", type=str, help="sched-scoreboard log directory of some other run that should be compared against the baseline")
-parser.add_option("-o", "--out", dest="out_file", type=str, help="Output file to store the schedstat comparison output")
-parser.add_option("-f", "--firstlist", dest="baseline_cpu_list", type=str, help="Restrict the comparison to the schedstats of this list of CPUs from the baseline run. Default : all cpus")
-parser.add_option("-s", "--secondlist", dest="compare_cpu_list", type=str, help="Restrict the comparison to the schedstats of this list of CPUs from the other run. Default : all cpus")
-
-(options, args) = parser.parse_args()
-
-def perct_diff(a, b):
-    a = float(a)
-    b = float(b)
-    if (a == 0.0):
-        return 0.0
-    c = (b / a) * 100.0 - 100.0
-    c = round(c, 2)
-    return c
+matrix_help_text = 'pct increase of every schedstat metric of every run [i] with respect to the baseline run [0], within |  | from %g%% on'
+stats_help_text = 'mean +- stddev of every schedstat metric over the runs of each group, pct increase of the mean of the other runs with respect to the mean of the baseline runs with its %g%% confidence interval, within |  | when significant (Welch t-test p < %g)'
+usage="python3 %prog -b baseline_logdir -c compare_logdir -o out_file [-f baseline_cpu_list] [-s compare_cpu_list] [-n]\n       python3 %prog -m -b baseline_logdir -o out_file [-f baseline_cpu_list] [-s compare_cpu_list] [-p pairs] logdir...\n       python3 %prog -S -b baseline_logdir,... -c compare_logdir,... -o out_file [-f baseline_cpu_list] [-s compare_cpu_list] [-A alpha]"
+
+writen = schedstat_parser.writen
+banner = schedstat_parser.banner_width * "-"
 
 ##########################################################
 # This function returns true if the float number has some
 # value after decimal point.
 ##########################################################
 def true_float(a):
-    int_a = int(a)
-    float_a = float(a)
-    if (float_a - int_a) > 0:
-        return True
-    return False
+    return not float(a).is_integer()
 
 #########################################################
 # This function aligns floats and integers in uniform
@@ -59,69 +46,402 @@ def write_align(a, extended_digits=None):
             line += f"{int(a):>6d}"
     return line
 
-def split_by_cpu(fp):
-    cpu = {}
-    lines = fp.readlines()
-    cpu_start = False
-    last_cpu_number = -1
-    last_cpu_start = -1
-    for i in range(0, len(lines)):
-        if lines[i].find("cpu:  cpu") == 0:
-            if cpu_start:
-                cpu[last_cpu_number] = lines[last_cpu_start:i]
-            cpu_start = True
-            last_cpu_start = i
-            last_cpu_number +=1
-    if cpu_start:
-        cpu[last_cpu_number] = lines[last_cpu_start:len(lines)]
-    return cpu
-
-def side_by_side(file1_lines, file2_lines):
+#########################################################
+# The system level part of the summary of a run, as the
+# numbers it shows: values holds all of them in the order
+# they are shown and lines the layout around them. A line
+# is ('text', line), ('node', header) or
+# ('metric', key, label, symbols, index) where the metric
+# value is values[index], followed by one value per pair
+# of symbols enclosing it, eg. $ freq $. summary is the
+# SchedStatSummary they come from, with the per CPU deltas.
+#########################################################
+class ComparableSummary:
+    def __init__(self, name, summary=None):
+        self.name = name
+        self.summary = summary
+        self.lines = []
+        self.values = []
+
+    def add_text(self, line):
+        self.lines.append(('text', line))
+
+    def add_node(self, header):
+        self.lines.append(('node', header))
+
+    def add_metric(self, key, label, value, extra=[]):
+        self.lines.append(('metric', key, label, tuple(symbols for (symbols, v) in extra), len(self.values)))
+        self.values.append(value)
+        self.values.extend(v for (symbols, v) in extra)
+
+    def get_layout(self):
+        # What has to be the same for two summaries to be compared. The
+        # labels are not, they can contain the cpu list.
+        layout = {'text': lambda line: line, 'node': lambda line: line[0], 'metric': lambda line: line[0:2] + line[3:4]}
+        return [layout[line[0]](line) for line in self.lines]
+
+def add_cpu_stats(cs, cpu_info, ctx):
+    cs.add_text(banner)
+    cs.add_node("cpu:  " + cpu_info.name)
+    cs.add_text(banner)
+
+    for k in schedstat_parser.get_keys_ver_map(cpu_info.version)['cpu_keys']:
+        if ctx.cpu_stats_show_list:
+            if not [x for x in ctx.cpu_stats_show_list if k['key'].find(x) != -1]:
+                continue
+
+        v = cpu_info.get_value(k)
+        extra = []
+        if 'pct_on' in k:
+            extra.append(('()', schedstat_parser.percentage(v, cpu_info.stats_map[k['pct_on']])))
+
+        cs.add_metric(k['key'], k['desc'] + ' :', v, extra)
+
+def add_domain_stats(cs, level, domain_info, inter_domain_lb_count, ctx):
+    domain_name = ctx.get_domain_name(domain_info.name)
+
+    if ctx.domains_show_list:
+        if not [x for x in ctx.domains_show_list if domain_name.find(x) != -1]:
+            return
+
+    cpulist_str = ''
+    if domain_info.cpumask != '0':
+        cpulist_str = '  | cpulist:  ' + domain_info.get_cpus_list(domain_info.cpumask)
+
+    cs.add_text(banner)
+    cs.add_node("domain:  " + domain_name + cpulist_str)
+    cs.add_text(banner)
+    last_cat = ''
+
+    for k in schedstat_parser.get_keys_ver_map(domain_info.version)['domain_keys']:
+        if ctx.domain_stats_show_list:
+            if not [x for x in ctx.domain_stats_show_list if k['key'].find(x) != -1]:
+                continue
+
+        category = k['key'].split('_')[0]
+        category_info = schedstat_parser.keys_category_info[category]
+        if category_info == "skip":
+            continue
+
+        if category != last_cat:
+            cs.add_text("< " + int((schedstat_parser.banner_width - 20) / 2) * "-" + "  Category:  " + category + ' ' + int((schedstat_parser.banner_width - 20) / 2) * "-" + " >")
+            last_cat = category
+
+        v = domain_info.get_value(k)
+        extra = []
+        if category_info == "count" and 'drop_stats' not in k:
+            extra.append(('$$', domain_info.get_freq(v)))
+            extra.append(('[]', schedstat_parser.percentage(v, inter_domain_lb_count)))
+
+        cs.add_metric((level, k['key']), k['desc'] + ' :', v, extra)
+
+def add_wakeups(cs, node, ctx):
+    total_wakeup = node.cpu_info.stats_map['ttwu_count']
+    cs.add_text("< " + int((schedstat_parser.banner_width - 20) / 2) * "-" + "  Wakeup info:  " + int((schedstat_parser.banner_width - 20) / 2) * "-" +  " >")
+
+    val = node.cpu_info.stats_map['l_ttwu_count']
+    cs.add_metric('l_ttwu_count', 'Wakeups on same         ' + f"{'CPU':>10s}" + " \t:", val, [('()', schedstat_parser.percentage(val, total_wakeup))])
+
+    for (title, key) in ('Wakeups on same         ', 'ttwu_awoke_task_dcsd'), ('Affine wakeups on same  ', 'ttwu_mv_task_cc'):
+        if key == 'ttwu_mv_task_cc':
+            cs.add_text('')
+
+        for (level, domain_info) in enumerate(node.domain_info_list):
+            name = ctx.get_domain_name(domain_info.name)
+            val = domain_info.stats_map[key]
+            cs.add_metric((level, key), title + f"{name:>10s}" + " \t:", val, [('()', schedstat_parser.percentage(val, total_wakeup))])
+
+def get_comparable(summary, name):
+    # The same lines as the system level info of summary.write()
+    ctx = summary.ctx
+    node = summary.system_level_node
+    cs = ComparableSummary(name, summary)
+
+    for line in schedstat_parser.help_text.split('\n'):
+        cs.add_text(line)
+
+    cs.add_text(banner)
+    cs.add_text("System level info:")
+    cs.add_text(banner)
+    cs.add_metric('time_elapsed', "Time elapsed (in jiffies)                                  :", summary.time_elapsed)
+
+    add_cpu_stats(cs, node.cpu_info, ctx)
+    for (level, domain_info) in enumerate(node.domain_info_list):
+        add_domain_stats(cs, level, domain_info, node.inter_domain_lb_count, ctx)
+    add_wakeups(cs, node, ctx)
+
+    cs.add_text(banner)
+    return cs
+
+def load_comparable(log_dir, cpu_list=None, pool=None, chunks=1):
+    domain_map_file = log_dir + '/domain_map.cfg'
+    if not os.path.exists(domain_map_file):
+        domain_map_file = None
+
+    ctx = schedstat_parser.make_context(domain_map_file, cpu_list)
+    before_file = schedstat_parser.get_snapshot_path(log_dir, 'schedstat-before')
+    after_file = schedstat_parser.get_snapshot_path(log_dir, 'schedstat-after')
+    summary = schedstat_parser.summarize(before_file, after_file, ctx, True, pool, chunks)
+    if summary is None:
+        return None
+
+    name = log_dir
+    if cpu_list:
+        name += ' (cpus ' + cpu_list + ')'
+
+    return get_comparable(summary, name)
+
+def load_comparables(runs, jobs=1):
+    # runs: [(log_dir, cpu_list)]. With more than one job, the runs are
+    # summarized concurrently, all their snapshots being parsed by one
+    # process pool.
+    if jobs <= 1:
+        return [load_comparable(log_dir, cpu_list) for (log_dir, cpu_list) in runs]
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool, \
+         concurrent.futures.ThreadPoolExecutor(len(runs)) as threads:
+        results = [threads.submit(load_comparable, log_dir, cpu_list, pool) for (log_dir, cpu_list) in runs]
+        return [r.result() for r in results]
+
+def perct_diff(base_values, comp_values):
+    # pct increase of every comp value with respect to the base one, 0 where
+    # the base value is 0
+    a = np.asarray(base_values, dtype=np.float64)
+    b = np.asarray(comp_values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(a == 0.0, 0.0, (b / a) * 100.0 - 100.0)
+
+def check_layouts(runs):
+    layout = runs[0].get_layout()
+
+    for r in runs[1:]:
+        if r.get_layout() != layout:
+            print('Error: ' + runs[0].name + ' and ' + r.name + ' do not have the same schedstat version and domains')
+            return False
+
+    return True
+
+def side_by_side(base, comp, threshold=5.0):
+    if not check_layouts([base, comp]):
+        return None
+
+    diff = perct_diff(base.values, comp.values)
+    show_diff = np.abs(np.round(diff, 2)) >= threshold
+
     out_lines = []
-    for j in range(0, len(file1_lines)):
-        l1 = file1_lines[j]
-        l2 = file2_lines[j]
-        if ":" in l1 and "Category:" not in l1 and "cpumask:" not in l1 and "cpu:" not in l1 and "domain:" not in l1 and "Wakeup info:" not in l1 and "level info" not in l1:
-            arr_start_index_l1 = l1.rindex(":") + 1
-            arr_start_index_l2 = l2.rindex(":") + 1
-            out_str = ""
-            out_str += l1[0: arr_start_index_l1]
-            arr1 = ' '.join(l1.rstrip()[arr_start_index_l1:].split()).split(' ')
-            arr2 = ' '.join(l2.rstrip()[arr_start_index_l2:].split()).split(' ')
-            for i in range(0, len(arr1)):
-                out_str += "  "
-                if arr1[i].replace('.', '', 1).isdigit():
-                    try:
-                        stat1 = float(arr1[i].strip())
-                        stat2 = float(arr2[i].strip())
-                        exteneded_digits = None
-                        if (i == 0):
-                            exteneded_digits = True
-                        out_str += write_align(stat1, exteneded_digits)
-                        out_str += ", "
-                        out_str += write_align(stat2, exteneded_digits)
-                        if (i == 0):
-                            diff = perct_diff(arr1[i].rstrip().lstrip().strip("$(){}[]<>"), arr2[i].rstrip().lstrip().strip("$(){}[]<>"))
-                            if abs(diff) >= 5.0:
-                                out_str += "  |"
-                                out_str += f"{diff:7.2f}"
-                                out_str += "|"
-                            else:
-                                out_str += " "*11
-                    except ValueError:
-                        print('Error in parsing input files: \n', 'base file line: ' + l1, 'comp file line: ' + l2)
-                        exit(1)
-                else:
-                    out_str += arr1[i].rstrip()
-            out_lines.append(out_str + '\n')
-        elif ":" in l1 and ("cpu:" in l1 or 'domain:' in l1):
-            out_lines.append(l1.replace('\n','') + ' vs ' + l2.replace('\n', '') + '\n')
-        elif ":" in l1 and "CPU level info:" in l1:
-            break
+    for (l1, l2) in zip(base.lines, comp.lines):
+        if l1[0] == 'text':
+            out_lines.append(l1[1] + '\n')
+            continue
+
+        if l1[0] == 'node':
+            out_lines.append(l1[1] + ' vs ' + l2[1] + '\n')
+            continue
+
+        (key, label, symbols, i) = l1[1:]
+        out_str = label + "  " + write_align(base.values[i], True) + ", " + write_align(comp.values[i], True)
+        if show_diff[i]:
+            out_str += "  |" + f"{diff[i]:7.2f}" + "|"
         else:
-            out_lines.append(l1)
+            out_str += " "*11
+
+        for (j, (s_open, s_close)) in enumerate(symbols, i + 1):
+            out_str += "  " + s_open + "  " + write_align(base.values[j]) + ", " + write_align(comp.values[j]) + "  " + s_close
+
+        out_lines.append(out_str + '\n')
+
     return out_lines
 
+#########################################################
+# Rows of the delta matrices of two runs to compare with
+# each other: in the order of their cpu lists when one is
+# given, so that -f 0-15 -s 16-31 compares cpu0 with cpu16
+# and so on, by cpu id otherwise.
+#########################################################
+def pair_rows(base, comp):
+    (b, c) = (base.summary, comp.summary)
+
+    if b.ctx.cpuset or c.ctx.cpuset:
+        if len(b.rows) != len(c.rows):
+            print('Error: ' + base.name + ' and ' + comp.name + ' do not have the same number of cpus to compare')
+            return (None, None)
+
+        return (b.rows, c.rows)
+
+    b_ids = b.delta.cpu_ids[b.rows].tolist()
+    pairs = [(row, c.delta.cpu_index[cpu_id]) for (row, cpu_id) in zip(b.rows.tolist(), b_ids) if cpu_id in c.delta.cpu_index]
+    return (np.array([p[0] for p in pairs], dtype=np.int64), np.array([p[1] for p in pairs], dtype=np.int64))
+
+def get_display_columns(matrix):
+    # Counter columns in the order of the summary. The domain counters of
+    # the skipped categories are left out, but for the wakeup info ones.
+    keys_ver_map = matrix.keys_ver_map
+    cpu_cols = [matrix.cpu_col[k['key']] for k in keys_ver_map['cpu_keys'] if k['is_derived'] == 0]
+    domain_cols = [matrix.domain_col[k['key']] for k in keys_ver_map['domain_keys']
+                   if k['is_derived'] == 0 and schedstat_parser.keys_category_info[k['key'].split('_')[0]] != "skip"]
+    domain_cols += [matrix.domain_col[k] for k in ('ttwu_awoke_task_dcsd', 'ttwu_mv_task_cc')]
+
+    return (np.array(cpu_cols, dtype=np.int64), np.array(domain_cols, dtype=np.int64))
+
+def node_metric_line(desc, v1, v2, diff):
+    return desc + ' :' + "  " + write_align(v1, True) + ", " + write_align(v2, True) + "  |" + f"{diff:7.2f}" + "|\n"
+
+#########################################################
+# Every CPU and domain level of two runs compared at once
+# on their delta matrices, only the counters differing by
+# the threshold or more being shown. Domains are paired
+# by level.
+#########################################################
+def node_lines(base, comp, threshold=5.0):
+    (b, c) = (base.summary, comp.summary)
+    (b_rows, c_rows) = pair_rows(base, comp)
+    if b_rows is None:
+        return None
+
+    (b_matrix, c_matrix) = (b.delta, c.delta)
+    (cpu_cols, domain_cols) = get_display_columns(b_matrix)
+    cpu_diff = perct_diff(b_matrix.cpu_data[b_rows][:, cpu_cols], c_matrix.cpu_data[c_rows][:, cpu_cols])
+
+    levels = min(b_matrix.domain_data.shape[1], c_matrix.domain_data.shape[1])
+    domain_diff = perct_diff(b_matrix.domain_data[b_rows, :levels][:, :, domain_cols], c_matrix.domain_data[c_rows, :levels][:, :, domain_cols])
+    common_levels = np.minimum(b_matrix.num_domains[b_rows], c_matrix.num_domains[c_rows])
+    domain_diff[np.arange(levels)[None, :] >= common_levels[:, None]] = 0.0
+
+    cpu_show = np.abs(np.round(cpu_diff, 2)) >= threshold
+    domain_show = np.abs(np.round(domain_diff, 2)) >= threshold
+    shown = np.nonzero(cpu_show.any(axis=1) | domain_show.any(axis=(1, 2)))[0]
+
+    out_lines = [banner + '\n',
+                 "CPU level info: " + str(len(shown)) + " of " + str(len(b_rows)) + " cpus with a metric differing by " + f"{threshold:g}" + "% or more\n",
+                 banner + '\n']
+
+    for i in shown.tolist():
+        (r1, r2) = (b_rows[i], c_rows[i])
+        out_lines.append("cpu:  " + b_matrix.cpu_names[r1] + " vs cpu:  " + c_matrix.cpu_names[r2] + '\n')
+
+        for m in np.nonzero(cpu_show[i])[0].tolist():
+            k = cpu_cols[m]
+            out_lines.append(node_metric_line(b_matrix.cpu_desc[k], b_matrix.cpu_data[r1, k].item(), c_matrix.cpu_data[r2, k].item(), cpu_diff[i, m]))
+
+        for j in np.nonzero(domain_show[i].any(axis=1))[0].tolist():
+            out_lines.append("domain:  " + b.ctx.get_domain_name(b_matrix.domain_names[r1][j]) + " vs domain:  " + c.ctx.get_domain_name(c_matrix.domain_names[r2][j]) + '\n')
+
+            for m in np.nonzero(domain_show[i, j])[0].tolist():
+                k = domain_cols[m]
+                out_lines.append(node_metric_line(b_matrix.domain_desc[k], b_matrix.domain_data[r1, j, k].item(), c_matrix.domain_data[r2, j, k].item(), domain_diff[i, j, m]))
+
+        out_lines.append(banner + '\n')
+
+    return out_lines
+
+def comparison_lines(base, comp, threshold=5.0, nodes=False):
+    out_lines = side_by_side(base, comp, threshold)
+    if out_lines is None:
+        return None
+
+    if nodes:
+        cpu_lines = node_lines(base, comp, threshold)
+        if cpu_lines is None:
+            return None
+        out_lines += cpu_lines
+
+    return ['comparison results : base_run : ' + base.name + ' vs '+ 'comp_run : ' + comp.name + '\n', comp_help_text + '\n'] + out_lines
+
+#########################################################
+# One line per metric: its value in the baseline run,
+# runs[0], and its pct increase in every other run. The
+# numbers of all the runs are compared in one go.
+#########################################################
+def get_metric_values(runs):
+    # runs x metrics array of the metric values (not the values shown
+    # next to them) of every run
+    index = [line[4] for line in runs[0].lines if line[0] == 'metric']
+    return np.array([r.values for r in runs], dtype=np.float64)[:, index]
+
+def matrix_lines(runs, threshold=5.0):
+    if not check_layouts(runs):
+        return None
+
+    base = runs[0]
+    values = get_metric_values(runs)
+    diff = perct_diff(values[0], values)
+    show_diff = np.abs(np.round(diff, 2)) >= threshold
+
+    out_lines = ['comparison matrix : baseline run : ' + base.name + '\n', matrix_help_text %(threshold) + '\n']
+    for (i, r) in enumerate(runs):
+        out_lines.append(f"[{i:2d}]  " + r.name + '\n')
+
+    out_lines.append(f"{'':60s}" + f"{'[0]':>14s}" + ''.join(f"{'[' + str(i) + ']':>11s}" for i in range(1, len(runs))) + '\n')
+
+    m = 0
+    for line in base.lines:
+        if line[0] != 'metric':
+            out_lines.append(line[1] + '\n')
+            continue
+
+        out_str = line[2] + "  " + write_align(base.values[line[4]], True)
+        for i in range(1, len(runs)):
+            if show_diff[i][m]:
+                out_str += "  |" + f"{diff[i][m]:7.2f}" + "|"
+            else:
+                out_str += "   " + f"{diff[i][m]:7.2f}" + " "
+
+        out_lines.append(out_str + '\n')
+        m += 1
+
+    return out_lines
+
+#########################################################
+# Groups of repeated runs of two configurations compared
+# with Welch's t-test, on all the metrics at once. A
+# difference is significant when its p-value is below
+# alpha and it is at least threshold pct.
+#########################################################
+def stats_lines(base_runs, comp_runs, alpha=0.05, threshold=0.0):
+    if not check_layouts(base_runs + comp_runs):
+        return None
+
+    test = schedstat_stats.WelchTest(get_metric_values(base_runs), get_metric_values(comp_runs), alpha)
+    diff = test.get_pct(test.diff)
+    (low, high) = (test.get_pct(test.low), test.get_pct(test.high))
+    show_diff = test.significant & (np.abs(np.round(diff, 2)) >= threshold)
+
+    out_lines = ['statistical comparison : base_runs : ' + ', '.join(r.name for r in base_runs) + ' vs '+ 'comp_runs : ' + ', '.join(r.name for r in comp_runs) + '\n',
+                 stats_help_text %(100 * (1 - alpha), alpha) + '\n']
+    out_lines.append(f"{'':60s}" + f"{'baseline mean':>14s}" + f"{'stddev':>14s}" + f"{'other mean':>16s}" + f"{'stddev':>14s}" + f"{'pct':>11s}" + f"{'confidence interval':>24s}" + f"{'p-value':>10s}" + '\n')
+
+    m = 0
+    for line in base_runs[0].lines:
+        if line[0] != 'metric':
+            out_lines.append(line[1] + '\n')
+            continue
+
+        out_str = line[2] + "  " + f"{test.base_mean[m]:12.2f} +- {test.base_std[m]:10.2f}" + "  " + f"{test.comp_mean[m]:12.2f} +- {test.comp_std[m]:10.2f}"
+        if show_diff[m]:
+            out_str += "  |" + f"{diff[m]:7.2f}" + "|"
+        else:
+            out_str += "   " + f"{diff[m]:7.2f}" + " "
+        out_str += "  [" + f"{low[m]:9.2f}" + ", " + f"{high[m]:9.2f}" + "  ]" + f"{test.pvalue[m]:10.4f}"
+
+        out_lines.append(out_str + '\n')
+        m += 1
+
+    return out_lines
+
+def parse_pairs(pairs_str, num_runs):
+    # "i:j,..." or "all", i and j being indices in the matrix
+    if pairs_str == 'all':
+        return [(i, j) for i in range(num_runs) for j in range(i + 1, num_runs)]
+
+    pairs = []
+    for s in pairs_str.split(','):
+        (i, j) = [int(x) for x in s.split(':')]
+        if i < 0 or j < 0 or i >= num_runs or j >= num_runs:
+            raise ValueError
+        pairs.append((i, j))
+
+    return pairs
+
 def parse_cpulist(cpulist):
     cs_str = cpulist.split(',')
     cs = []
@@ -135,39 +455,96 @@ def parse_cpulist(cpulist):
     return cs
 
 if __name__ == "__main__":
-    base_file = options.baseline_log_dir + '/schedstat-summary'
-    comp_file = options.compare_log_dir + '/schedstat-summary'
+    parser = OptionParser(usage)
+    parser.add_option("-b", "--basedir", dest="baseline_log_dir", type=str, help="sched-scoreboard log directory of the run that should be considered as the baseline")
+    parser.add_option("-c", "--compdir", dest="compare_log_dir", type=str, help="sched-scoreboard log directory of some other run that should be compared against the baseline")
+    parser.add_option("-o", "--out", dest="out_file", type=str, help="Output file to store the schedstat comparison output")
+    parser.add_option("-f", "--firstlist", dest="baseline_cpu_list", type=str, help="Restrict the comparison to the schedstats of this list of CPUs from the baseline run. Default : all cpus")
+    parser.add_option("-s", "--secondlist", dest="compare_cpu_list", type=str, help="Restrict the comparison to the schedstats of this list of CPUs from the other run. Default : all cpus")
+    parser.add_option("-j", "--jobs", dest="jobs", type=int, default=1, help="Number of worker processes. With more than one, the snapshots of all the runs are parsed in parallel. Default : 1")
+    parser.add_option("-m", "--matrix", dest="matrix", action="store_true", default=False, help="Compare the baseline run with the compare run, if any, and with every log directory given as argument, in one matrix. The cpu list of the other runs is -s")
+    parser.add_option("-n", "--nodes", dest="nodes", action="store_true", default=False, help="Also compare every CPU and domain of the cpu lists, paired in the order of the lists (by cpu id without lists), and show those with a metric differing by the threshold or more")
+    parser.add_option("-t", "--threshold", dest="threshold", type=float, help="pct increase from which a difference is shown. Default : 5, 0 with -S")
+    parser.add_option("-S", "--stats", dest="stats", action="store_true", default=False, help="-b and -c are comma separated log directories of repeated runs of two configurations, at least 2 each. Compare the mean of every metric over the runs of each group and only show the statistically significant differences")
+    parser.add_option("-A", "--alpha", dest="alpha", type=float, default=0.05, help="With -S, significance level of the differences: the confidence intervals are at 1 - alpha. Default : 0.05")
+    parser.add_option("-p", "--pairs", dest="pairs", type=str, help="With -m, also compare these pairs of runs side by side: comma separated i:j matrix indices, or all")
+
+    (options, args) = parser.parse_args()
+
     if options.baseline_cpu_list:
         try:
-            fs = parse_cpulist(options.baseline_cpu_list)
+            parse_cpulist(options.baseline_cpu_list)
         except ValueError:
             print('Error: baseline cpu list not valid')
             print(usage)
             exit(1)
-        fs_mask = 0
-        for i in fs:
-            fs_mask |= 1 << i
-        base_file += '-' + hex(fs_mask)
     if options.compare_cpu_list:
         try:
-            ss = parse_cpulist(options.compare_cpu_list)
+            parse_cpulist(options.compare_cpu_list)
         except ValueError:
             print('Error: comapare cpu list not valid')
             print(usage)
             exit(1)
-        ss_mask = 0
-        for i in ss:
-            ss_mask |= 1 << i
-        comp_file += '-' + hex(ss_mask)
-    import schedstat_parser
-    schedstat_parser.main(options.baseline_log_dir + '/schedstat-before', options.baseline_log_dir + '/schedstat-after',
-            base_file, options.baseline_log_dir + '/domain_map.cfg', options.baseline_cpu_list)
-    schedstat_parser.main(options.compare_log_dir + '/schedstat-before', options.compare_log_dir + '/schedstat-after',
-            comp_file, options.compare_log_dir + '/domain_map.cfg', options.compare_cpu_list)
-    with open(base_file, "r") as sf1, open(comp_file, "r") as sf2, open(options.out_file, "w") as sf3:
-        file1_lines = sf1.readlines()
-        file2_lines = sf2.readlines()
-        sf3.writelines('comparison results : base_file : ' + base_file + ' vs '+ 'comp_file : ' + comp_file + '\n')
-        sf3.writelines(comp_help_text + '\n')
-        out_lines = side_by_side(file1_lines, file2_lines)
+
+    threshold = options.threshold
+    if threshold is None:
+        threshold = 0.0 if options.stats else 5.0
+
+    runs = [(options.baseline_log_dir, options.baseline_cpu_list)]
+    if options.compare_log_dir:
+        runs.append((options.compare_log_dir, options.compare_cpu_list))
+    if options.matrix:
+        runs += [(log_dir, options.compare_cpu_list) for log_dir in args]
+
+    if not options.baseline_log_dir or len(runs) < 2:
+        print('Error: Need at least 2 log directories')
+        print(usage)
+        exit(1)
+
+    num_base_runs = 1
+    if options.stats:
+        base_runs = [(log_dir, options.baseline_cpu_list) for log_dir in options.baseline_log_dir.split(',')]
+        comp_runs = [(log_dir, options.compare_cpu_list) for log_dir in options.compare_log_dir.split(',')]
+        if len(base_runs) < 2 or len(comp_runs) < 2:
+            print('Error: Need at least 2 log directories of each configuration')
+            print(usage)
+            exit(1)
+
+        if not 0 < options.alpha < 1:
+            print('Error: alpha not valid')
+            exit(1)
+
+        runs = base_runs + comp_runs
+        num_base_runs = len(base_runs)
+
+    pairs = []
+    if options.matrix and options.pairs:
+        try:
+            pairs = parse_pairs(options.pairs, len(runs))
+        except ValueError:
+            print('Error: pairs not valid')
+            print(usage)
+            exit(1)
+
+    # Every log directory is summarized once, whatever the number of
+    # comparisons it is part of
+    comparables = load_comparables(runs, options.jobs)
+    if None in comparables:
+        exit(1)
+
+    if options.stats:
+        out_lines = stats_lines(comparables[:num_base_runs], comparables[num_base_runs:], options.alpha, threshold)
+    elif options.matrix:
+        out_lines = matrix_lines(comparables, threshold)
+        for (i, j) in pairs:
+            if out_lines is not None:
+                pair_lines = comparison_lines(comparables[i], comparables[j], threshold, options.nodes)
+                out_lines = out_lines + ['\n'] + pair_lines if pair_lines is not None else None
+    else:
+        out_lines = comparison_lines(comparables[0], comparables[1], threshold, options.nodes)
+
+    if out_lines is None:
+        exit(1)
+
+    with open(options.out_file, "w") as sf3:
         sf3.writelines(out_lines)
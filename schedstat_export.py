@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Structured export of a schedstat summary.
+#
+# The dataset is computed from the delta SchedStatMatrix as whole columns,
+# keyed as <level>.<key>[.<metric>] where level is one of
+#
+#   system : the cpuset average (1 x keys, 1 x domains x keys)
+#   cpu    : one value per CPU of the cpuset
+#   domain : one value per CPU and domain (padded, see domain.valid)
+#
+# and metric one of pct (cpu keys with a pct_on key), pct_category,
+# pct_domain, pct_cpu (share of the load balancing count of the category,
+# the domain and all the domains of the CPU) and period (the $...$ avg
+# period in jiffies of the text summary). The dataset is written either as
+# a .npz archive of those arrays or as JSON Lines, one record per system,
+# CPU and domain.
+
+import json
+import numpy as np
+import derived_metrics
+import schedstat_parser
+
+def percentage(values, totals):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(totals == 0, 0.0, 100.0 * values / totals)
+
+def get_values(matrix, section, data):
+    # Raw and derived values of every key of section, in schema order
+    keys = matrix.cpu_keys if section == 'cpu_keys' else matrix.domain_keys
+    values = {k: data[..., i] for i, k in enumerate(keys)}
+
+    metrics = derived_metrics.get_schema_metrics(matrix.version, matrix.keys_ver_map)[section]
+    for key, metric in metrics.items():
+        values[key] = metric.eval_columns([values[v] for v in metric.values])
+
+    return {k['key']: values[k['key']] for k in matrix.keys_ver_map[section]}
+
+def get_columns(matrix, level, cpu_data, domain_data, elapsed):
+    columns = {}
+
+    cpu_values = get_values(matrix, 'cpu_keys', cpu_data)
+    for k in matrix.keys_ver_map['cpu_keys']:
+        key = k['key']
+        columns[level + '.cpu.' + key] = cpu_values[key]
+        if 'pct_on' in k:
+            columns[level + '.cpu.' + key + '.pct'] = percentage(cpu_values[key], cpu_values[k['pct_on']])
+
+    category_totals = {c: domain_data[:, :, i] for c, i in matrix.category_cols.items()}
+    domain_total = sum(category_totals.values())
+    cpu_total = domain_total.sum(axis=1, keepdims=True)
+
+    domain_values = get_values(matrix, 'domain_keys', domain_data)
+    for k in matrix.keys_ver_map['domain_keys']:
+        key = k['key']
+        v = domain_values[key]
+        name = level + '.domain.' + key
+        columns[name] = v
+
+        category = key.split('_')[0]
+        if schedstat_parser.keys_category_info.get(category) != "count":
+            continue
+
+        columns[name + '.pct_category'] = percentage(v, category_totals[category])
+        columns[name + '.pct_domain'] = percentage(v, domain_total)
+        columns[name + '.pct_cpu'] = percentage(v, cpu_total)
+
+        if 'drop_stats' not in k:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns[name + '.period'] = np.where(v == 0, 0.0, elapsed / v)
+
+    return columns
+
+def get_dataset(matrix, rows, system_level_desc_str, domain_map=None):
+    # matrix holds the deltas, rows the selected CPUs (see SchedStatMatrix.select)
+    if domain_map is None:
+        domain_map = {}
+
+    elapsed = matrix.timestamp
+    cpu_avg, domain_avg = matrix.average(rows)
+    num_system_domains = int(matrix.num_domains[0])
+
+    dataset = {
+        'version'         : np.array(int(matrix.version)),
+        'elapsed'         : np.array(elapsed),
+        'system.name'     : np.array([system_level_desc_str]),
+        'system.domains'  : np.array([domain_map.get(d, d) for d in matrix.domain_names[0]]),
+        'cpu.name'        : np.array([matrix.cpu_names[r] for r in rows]),
+        'cpu.id'          : matrix.cpu_ids[rows],
+        'domain.valid'    : np.arange(matrix.domain_data.shape[1]) < matrix.num_domains[rows][:, None],
+    }
+
+    max_domains = matrix.domain_data.shape[1]
+    domain_names = [[domain_map.get(d, d) for d in matrix.domain_names[r]] for r in rows]
+    cpumasks = [matrix.cpumasks[r] for r in rows]
+    dataset['domain.name'] = np.array([d + [''] * (max_domains - len(d)) for d in domain_names]).reshape(len(rows), max_domains)
+    dataset['domain.cpumask'] = np.array([c + [''] * (max_domains - len(c)) for c in cpumasks]).reshape(len(rows), max_domains)
+
+    system_cpu = np.array([cpu_avg], dtype=np.int64)
+    system_domain = np.array([domain_avg[:num_system_domains]], dtype=np.int64).reshape(1, num_system_domains, -1)
+    dataset.update(get_columns(matrix, 'system', system_cpu, system_domain, elapsed))
+
+    dataset.update(get_columns(matrix, 'per', matrix.cpu_data[rows], matrix.domain_data[rows], elapsed))
+
+    # 'per.cpu.*' / 'per.domain.*' -> 'cpu.*' / 'domain.*'
+    return {(k[4:] if k.startswith('per.') else k): v for k, v in dataset.items()}
+
+def to_json_value(v):
+    if isinstance(v, float) and v != v:
+        return None
+    return v
+
+def get_record_columns(dataset, prefix):
+    # [(key, metric, values as python lists)] of the columns under prefix
+    columns = []
+
+    for name, column in dataset.items():
+        if not name.startswith(prefix):
+            continue
+
+        tokens = name[len(prefix):].split('.')
+        if len(tokens) == 1 and tokens[0] in ('name', 'id', 'valid', 'cpumask', 'domains'):
+            continue
+
+        metric = tokens[1] if len(tokens) > 1 else 'value'
+        columns.append((tokens[0], metric, column.tolist()))
+
+    return columns
+
+def get_record(columns, i, j=None):
+    # {key: {metric: value}} of CPU i (and domain j)
+    record = {}
+
+    for (key, metric, values) in columns:
+        v = values[i] if j is None else values[i][j]
+        record.setdefault(key, {})[metric] = to_json_value(v)
+
+    return record
+
+def write_jsonl(out_file, dataset):
+    system_cpu = get_record_columns(dataset, 'system.cpu.')
+    system_domain = get_record_columns(dataset, 'system.domain.')
+    cpu = get_record_columns(dataset, 'cpu.')
+    domain = get_record_columns(dataset, 'domain.')
+
+    domain_names = dataset['domain.name'].tolist()
+    cpumasks = dataset['domain.cpumask'].tolist()
+
+    with open(out_file, 'w') as out:
+        out.write(json.dumps({'type': 'summary', 'version': int(dataset['version']), 'elapsed': int(dataset['elapsed'])}) + '\n')
+
+        out.write(json.dumps({'type': 'system_cpu', 'name': str(dataset['system.name'][0]),
+                              'stats': get_record(system_cpu, 0)}) + '\n')
+
+        for j, d_name in enumerate(dataset['system.domains'].tolist()):
+            out.write(json.dumps({'type': 'system_domain', 'name': d_name, 'level': j,
+                                  'stats': get_record(system_domain, 0, j)}) + '\n')
+
+        for i, cpu_name in enumerate(dataset['cpu.name'].tolist()):
+            out.write(json.dumps({'type': 'cpu', 'name': cpu_name,
+                                  'stats': get_record(cpu, i)}) + '\n')
+
+            for j in np.flatnonzero(dataset['domain.valid'][i]).tolist():
+                out.write(json.dumps({'type': 'domain', 'cpu': cpu_name, 'level': j,
+                                      'name': domain_names[i][j], 'cpumask': cpumasks[i][j],
+                                      'stats': get_record(domain, i, j)}) + '\n')
+
+def write_npz(out_file, dataset):
+    np.savez_compressed(out_file, **dataset)
+
+def export(out_file, matrix, rows, system_level_desc_str, domain_map=None):
+    dataset = get_dataset(matrix, rows, system_level_desc_str, domain_map)
+
+    if out_file.endswith('.npz'):
+        write_npz(out_file, dataset)
+    else:
+        write_jsonl(out_file, dataset)
+
+    return dataset
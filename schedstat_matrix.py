@@ -0,0 +1,468 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Columnar representation of a /proc/schedstat snapshot.
+#
+# Instead of one CPUStats/DomainStats object (and one stats_map dict) per
+# line, a snapshot is held as
+#
+#   cpu_data    : cpus x cpu_keys             int64 matrix
+#   domain_data : cpus x domains x domain_keys int64 tensor
+#
+# with the column order resolved once from the vNN.json schema (the same
+# input_pos ordering used by CPUStats.parse/DomainStats.parse). Deltas,
+# cpuset averaging and the per-domain lb totals are whole-array operations.
+# Nodes are only materialized (see schedstat_parser.get_matrix_node) for
+# the rows that are actually rendered.
+#
+# A snapshot can also be stored in a binary form (see to_binary()): a fixed
+# header, a JSON blob with the key schema, cpu/domain names and cpumasks,
+# then cpu_data and domain_data as little-endian int64 arrays, 8-byte
+# aligned. load_binary() maps the arrays straight onto the buffer without
+# copying. Binary records may be concatenated, eg. for a timeline. The text
+# of a "snapshot <secs>" timeline marker is kept in the JSON blob as well,
+# the double of the header not holding all the digits of date +%s.%N.
+
+import re
+import json
+import math
+import mmap
+import struct
+import numpy as np
+import derived_metrics
+import schedstat_parser
+
+binary_magic = b'SCHEDSTB'
+binary_format_version = 1
+
+# magic, format version, schedstat version, walltime (nan if unknown),
+# timestamp, cpus, max domains, cpu keys, domain keys, metadata length,
+# record length
+binary_header = struct.Struct('<8sIIdqIIIII4xQ')
+
+# Translation table blanking out every byte that is not a decimal digit
+digits_only = bytes(c if 48 <= c <= 57 else 32 for c in range(256))
+
+def get_category_columns(domain_keys):
+    # Column of the first key of every "count" category, mirrors the
+    # walk done by DomainStats.calculate_category_totals()
+    category_cols = {}
+
+    for i, k in enumerate(domain_keys):
+        category = k.split('_')[0]
+        if category not in schedstat_parser.keys_category_info.keys():
+            print('Error: Error parsing category')
+            return None
+
+        if schedstat_parser.keys_category_info[category] != "count":
+            continue
+
+        if category not in category_cols:
+            category_cols[category] = i
+
+    return category_cols
+
+def is_binary(file_path):
+    with open(file_path, 'rb') as sched_file:
+        return sched_file.read(len(binary_magic)) == binary_magic
+
+def get_binary_record(buf, offset=0):
+    # (walltime, timestamp, record length) of the binary record at offset,
+    # None if there is no complete record there
+    if offset + binary_header.size > len(buf):
+        return None
+
+    h = binary_header.unpack_from(buf, offset)
+    if h[0] != binary_magic or offset + h[10] > len(buf):
+        return None
+
+    walltime = None if math.isnan(h[3]) else h[3]
+    return (walltime, h[4], h[10])
+
+class SchedStatMatrix:
+    def __init__(self, name=None):
+        if name:
+            self.name = name
+
+        self.version = 'unknown'
+        self.timestamp = 0
+        self.walltime = None
+        self.walltime_text = None
+        self.keys_ver_map = None
+        self.plan = None
+        self.cpu_keys = ()
+        self.cpu_desc = ()
+        self.domain_keys = ()
+        self.domain_desc = ()
+        self.cpu_names = []
+        self.domain_names = []
+        self.cpumasks = []
+        self.cpu_ids = np.zeros(0, dtype=np.int64)
+        self.cpu_index = {}
+        self.num_domains = np.zeros(0, dtype=np.int64)
+        self.cpu_data = None
+        self.domain_data = None
+        self.layout = None
+
+    def set_version(self, version):
+        self.plan = schedstat_parser.get_parse_plan(version)
+        if self.plan is None:
+            return -1
+
+        self.keys_ver_map = schedstat_parser.get_keys_ver_map(version)
+        self.version = version
+        self.cpu_keys, self.cpu_desc = self.plan.cpu_keys, self.plan.cpu_desc
+        self.domain_keys, self.domain_desc = self.plan.domain_keys, self.plan.domain_desc
+        self.cpu_col = {k: i for i, k in enumerate(self.cpu_keys)}
+        self.domain_col = {k: i for i, k in enumerate(self.domain_keys)}
+        self.category_cols = get_category_columns(self.domain_keys)
+        if self.category_cols is None:
+            return -1
+
+        return 0
+
+    def parse(self, file_path):
+        if is_binary(file_path):
+            return self.parse_binary(file_path)
+
+        with open(file_path, 'r') as sched_file:
+            return self.parse_lines(sched_file)
+
+    def parse_binary(self, file_path, offset=0):
+        # Copy-on-write mapping: nothing is read until used, and the
+        # arrays can still be modified in place (eg. by subtract())
+        with open(file_path, 'rb') as sched_file:
+            buf = mmap.mmap(sched_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        return self.load_binary(buf, offset)
+
+    def parse_lines(self, lines):
+        self.cpu_names = []
+        self.domain_names = []
+        self.cpumasks = []
+        self.layout = None
+        cpu_rows = []
+        domain_rows = []
+
+        for line in lines:
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            if tokens[0].startswith('version'):
+                if self.set_version(tokens[1].strip()) != 0:
+                    return -1
+                dname_idx = self.plan.dname_idx
+
+            elif tokens[0].startswith('timestamp'):
+                self.timestamp = int(tokens[1])
+
+            elif tokens[0].startswith('cpu'):
+                if self.version == 'unknown':
+                    print('Error: version info missing')
+                    return -1
+
+                values = list(map(int, tokens[self.plan.cpu_values_pos:]))
+                if len(values) < len(self.cpu_keys):
+                    print('Error: SchedStatMatrix.parse : short cpu line : ', tokens[0])
+                    return -1
+
+                self.cpu_names.append(tokens[0])
+                self.domain_names.append([])
+                self.cpumasks.append([])
+                cpu_rows.append(values[:len(self.cpu_keys)])
+                domain_rows.append([])
+
+            elif tokens[0].startswith('domain'):
+                if self.version == 'unknown':
+                    print('Error: version info missing')
+                    return -1
+                if not cpu_rows:
+                    print("Error: invalid node number")
+                    return -1
+
+                values = list(map(int, tokens[self.plan.domain_values_pos:]))
+                if len(values) < len(self.domain_keys):
+                    print('Error: SchedStatMatrix.parse : short domain line : ', tokens[0])
+                    return -1
+
+                self.domain_names[-1].append(tokens[dname_idx])
+                self.cpumasks[-1].append(tokens[dname_idx + 1])
+                domain_rows[-1].append(values[:len(self.domain_keys)])
+
+        return self.build(cpu_rows, domain_rows)
+
+    def build(self, cpu_rows, domain_rows):
+        ncpus = len(cpu_rows)
+        self.num_domains = np.array([len(d) for d in domain_rows], dtype=np.int64)
+        max_domains = int(self.num_domains.max()) if ncpus else 0
+
+        self.cpu_ids = np.array([int(n.split('u')[1]) for n in self.cpu_names], dtype=np.int64)
+        self.build_cpu_index()
+        self.cpu_data = np.array(cpu_rows, dtype=np.int64).reshape(ncpus, len(self.cpu_keys))
+        self.domain_data = np.zeros((ncpus, max_domains, len(self.domain_keys)), dtype=np.int64)
+
+        for i, rows in enumerate(domain_rows):
+            if rows:
+                self.domain_data[i, :len(rows)] = rows
+
+        return 0
+
+    def load_binary(self, buf, offset=0):
+        if get_binary_record(buf, offset) is None:
+            print('Error: SchedStatMatrix.load_binary : invalid or truncated record')
+            return -1
+
+        (magic, fmt_version, version, walltime, timestamp, ncpus, max_domains,
+         n_cpu_keys, n_domain_keys, meta_len, record_len) = binary_header.unpack_from(buf, offset)
+
+        if fmt_version != binary_format_version:
+            print('Error: unsupported binary format version ', fmt_version)
+            return -1
+
+        if self.set_version(str(version)) != 0:
+            return -1
+
+        pos = offset + binary_header.size
+        meta = json.loads(bytes(buf[pos:pos + meta_len]))
+        if tuple(meta['cpu_keys']) != self.cpu_keys or tuple(meta['domain_keys']) != self.domain_keys:
+            print('Error: key schema of the binary snapshot does not match version ', version)
+            return -1
+
+        self.walltime = None if math.isnan(walltime) else walltime
+        self.walltime_text = meta.get('walltime')
+        self.timestamp = timestamp
+        self.cpu_names = meta['cpu_names']
+        self.domain_names = meta['domain_names']
+        self.cpumasks = meta['cpumasks']
+        self.layout = None
+
+        pos += meta_len
+        self.cpu_data = np.frombuffer(buf, dtype='<i8', count=ncpus * n_cpu_keys, offset=pos)
+        self.cpu_data = self.cpu_data.reshape(ncpus, n_cpu_keys)
+
+        pos += self.cpu_data.nbytes
+        self.domain_data = np.frombuffer(buf, dtype='<i8', count=ncpus * max_domains * n_domain_keys, offset=pos)
+        self.domain_data = self.domain_data.reshape(ncpus, max_domains, n_domain_keys)
+
+        self.num_domains = np.array([len(d) for d in self.domain_names], dtype=np.int64)
+        self.cpu_ids = np.array([int(n.split('u')[1]) for n in self.cpu_names], dtype=np.int64)
+        self.build_cpu_index()
+
+        return 0
+
+    def to_binary(self, walltime=None, walltime_text=None):
+        # walltime_text: the walltime as written in a timeline marker
+        meta = {
+            'cpu_keys'     : self.cpu_keys,
+            'domain_keys'  : self.domain_keys,
+            'cpu_names'    : self.cpu_names,
+            'domain_names' : self.domain_names,
+            'cpumasks'     : self.cpumasks,
+        }
+        if walltime_text is not None:
+            meta['walltime'] = walltime_text
+        meta = json.dumps(meta).encode()
+        meta += b' ' * (-len(meta) % 8)
+
+        cpu = self.cpu_data.astype('<i8').tobytes()
+        domain = self.domain_data.astype('<i8').tobytes()
+        record_len = binary_header.size + len(meta) + len(cpu) + len(domain)
+
+        header = binary_header.pack(binary_magic, binary_format_version, int(self.version),
+                                    math.nan if walltime is None else walltime, self.timestamp,
+                                    self.cpu_data.shape[0], self.domain_data.shape[1],
+                                    len(self.cpu_keys), len(self.domain_keys), len(meta), record_len)
+
+        return header + meta + cpu + domain
+
+    def write_text(self, out):
+        # Same layout as /proc/schedstat
+        out.write('version ' + self.version + '\n')
+        out.write('timestamp ' + str(self.timestamp) + '\n')
+
+        for i, cpu_name in enumerate(self.cpu_names):
+            out.write(' '.join([cpu_name] + [str(v) for v in self.cpu_data[i].tolist()]) + '\n')
+
+            for j in range(len(self.domain_names[i])):
+                tokens = ['domain' + str(j)]
+                if int(self.version) >= 17:
+                    tokens.append(self.domain_names[i][j])
+                tokens.append(self.cpumasks[i][j])
+                tokens += [str(v) for v in self.domain_data[i, j].tolist()]
+                out.write(' '.join(tokens) + '\n')
+
+    def get_domain_re(self):
+        # Head of a domain line, the name (v17+) and cpumask being captured
+        if self.plan.dname_idx:
+            return re.compile(rb'\ndomain[0-9]+ ([^ ]+ [^ ]+)')
+
+        return re.compile(rb'\ndomain[0-9]+ ([^ ]+)')
+
+    def split_domains(self, data, domain_re):
+        # (counter text, domain heads) of data. Every domain line is left as
+        # "domain <counters>", without the name and cpumask which are not
+        # counters, and the hex digits of the cpumask would be read as some.
+        parts = domain_re.split(data)
+        return (b'\ndomain'.join(parts[0::2]), parts[1::2])
+
+    def build_layout(self, data):
+        # Position of the timestamp, of every cpu id and of every counter in
+        # the stream of digit runs of the counter text of data (see
+        # refresh()). Domain slots that are only padding point past the end
+        # of the stream.
+        pos = 0
+        ts_pos = 0
+        id_pos = []
+        cpu_pos = []
+        domain_pos = []
+        domain_re = self.get_domain_re()
+        (text, domain_heads) = self.split_domains(data, domain_re)
+
+        for line in text.split(b'\n'):
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            n = len(line.translate(digits_only).split())
+            if tokens[0].startswith(b'timestamp'):
+                ts_pos = pos + n - 1
+            elif tokens[0].startswith(b'cpu'):
+                start = pos + n - (len(tokens) - 1)
+                id_pos.append(start - 1)
+                cpu_pos.append(range(start, start + len(self.cpu_keys)))
+                domain_pos.append([])
+            elif tokens[0].startswith(b'domain'):
+                start = pos + n - (len(tokens) - 1)
+                domain_pos[-1].append(range(start, start + len(self.domain_keys)))
+
+            pos += n
+
+        padding = [range(pos, pos + len(self.domain_keys))]
+        max_domains = self.domain_data.shape[1]
+        domain_pos = [d + padding * (max_domains - len(d)) for d in domain_pos]
+
+        self.layout = {
+            'size'         : pos,
+            'timestamp'    : ts_pos,
+            'domain_re'    : domain_re,
+            'domain_heads' : domain_heads,
+            'cpu_ids'      : np.array(id_pos, dtype=np.int64),
+            'cpu_pos'      : np.array(cpu_pos, dtype=np.int64).reshape(self.cpu_data.shape),
+            'domain_pos'   : np.array(domain_pos, dtype=np.int64).reshape(self.domain_data.shape),
+        }
+
+    def refresh(self, data):
+        # Re-read a snapshot (bytes) of the same machine into the existing
+        # arrays. The domain names and cpumasks are cut out and compared as
+        # bytes with those of the first snapshot. Every non-digit byte of the
+        # rest is blanked out so it is converted by numpy in one call, and
+        # the counters are gathered at the positions learned from the first
+        # snapshot. Falls back to a full parse whenever cpus, domains or
+        # cpumasks change.
+        layout = self.layout
+        if layout is not None:
+            (text, domain_heads) = self.split_domains(data, layout['domain_re'])
+            values = np.fromstring(text.translate(digits_only), dtype=np.int64, sep=' ')
+
+        if layout is None or domain_heads != layout['domain_heads'] or \
+           len(values) != layout['size'] or \
+           not np.array_equal(values[layout['cpu_ids']], self.cpu_ids):
+            if self.parse_lines(data.decode().splitlines()) != 0:
+                return -1
+            self.build_layout(data)
+            return 0
+
+        # One trailing zero for the padded domain slots
+        values = np.append(values, 0)
+        self.timestamp = int(values[layout['timestamp']])
+        np.take(values, layout['cpu_pos'], out=self.cpu_data)
+        np.take(values, layout['domain_pos'], out=self.domain_data)
+        return 0
+
+    def check_compatible(self, b):
+        if self.cpu_data.shape != b.cpu_data.shape or self.domain_data.shape != b.domain_data.shape:
+            return False
+
+        return np.array_equal(self.num_domains, b.num_domains)
+
+    def add(self, b):
+        if not self.check_compatible(b):
+            print("Error: Addition failed, shape mismatch")
+            return -1
+
+        self.cpu_data += b.cpu_data
+        self.domain_data += b.domain_data
+        return 0
+
+    def subtract(self, b):
+        if not self.check_compatible(b):
+            print("Error: subtract failed, shape mismatch")
+            return -1
+
+        self.timestamp -= b.timestamp
+        self.cpu_data -= b.cpu_data
+        self.domain_data -= b.domain_data
+        return 0
+
+    def reverse_subtract(self, b):
+        # self = b - self, reusing the buffers of self. Used to turn the
+        # older of two consecutive snapshots into their delta in place.
+        if not self.check_compatible(b):
+            print("Error: subtract failed, shape mismatch")
+            return -1
+
+        self.timestamp = b.timestamp - self.timestamp
+        np.subtract(b.cpu_data, self.cpu_data, out=self.cpu_data)
+        np.subtract(b.domain_data, self.domain_data, out=self.domain_data)
+        return 0
+
+    def build_cpu_index(self):
+        # cpu id -> row, the first row wins for duplicate ids
+        self.cpu_index = {}
+        for row, cpu_id in enumerate(self.cpu_ids.tolist()):
+            self.cpu_index.setdefault(cpu_id, row)
+
+    def select(self, cpuset=None):
+        if not cpuset:
+            return np.arange(len(self.cpu_names))
+
+        rows = [self.cpu_index[i] for i in cpuset if i in self.cpu_index]
+        return np.array(rows, dtype=np.int64)
+
+    def calculate_domain_totals(self):
+        cols = list(self.category_cols.values())
+        self.category_lb_count = self.domain_data[:, :, cols]
+        self.domain_lb_count = self.category_lb_count.sum(axis=2)
+        self.inter_domain_lb_count = self.domain_lb_count.sum(axis=1)
+
+    def calculate_node_totals(self, rows):
+        self.calculate_domain_totals()
+        self.inter_nodes_lb_count = int(self.inter_domain_lb_count[rows].sum())
+
+    def calculate_derived(self):
+        # One vector evaluation per derived key, over every CPU (and domain)
+        metrics = derived_metrics.get_schema_metrics(self.version, self.keys_ver_map)
+
+        self.cpu_derived = {}
+        for key, metric in metrics['cpu_keys'].items():
+            columns = [self.cpu_data[:, self.cpu_col[v]] for v in metric.values]
+            self.cpu_derived[key] = metric.eval_columns(columns)
+
+        self.domain_derived = {}
+        for key, metric in metrics['domain_keys'].items():
+            columns = [self.domain_data[:, :, self.domain_col[v]] for v in metric.values]
+            self.domain_derived[key] = metric.eval_columns(columns)
+
+    def average(self, rows):
+        # Summation and division are done on the whole int64 column, the
+        # quotient truncated toward zero like Stats.scaler_div() but without
+        # going through a float.
+        n = len(rows)
+        cpu_sum = self.cpu_data[rows].sum(axis=0)
+        domain_sum = self.domain_data[rows].sum(axis=0)
+
+        cpu_avg = (np.abs(cpu_sum) // n * np.sign(cpu_sum)).tolist()
+        domain_avg = (np.abs(domain_sum) // n * np.sign(domain_sum)).tolist()
+
+        return cpu_avg, domain_avg
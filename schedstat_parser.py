@@ -6,9 +6,14 @@
 #          Gautham R Shenoy <gautham.shenoy@amd.com>,
 #          K Prateek Nayak <kprateek.nayak@amd.com>
 
+import io
 import sys
 import json
 import os.path
+import threading
+import concurrent.futures
+import derived_metrics
+import phase_profile
 from optparse import OptionParser
 
 banner_width = 100
@@ -16,11 +21,11 @@ help_text  = ''
 help_text += 'pct within the CPU represented by [...]\n'
 help_text += 'avg period in jiffies represented by $...$\n'
 
-keys_ver_map = None
-domain_map = {}
-cpu_stats_show_list = None
-domain_stats_show_list = None
-domains_show_list = None
+# Schemas and parse plans are cached per version and never modified once
+# built, everything else a summary depends on is in a SchedStatContext
+keys_ver_map_cache = {}
+parse_plan_cache = {}
+schema_lock = threading.RLock()
 
 keys_category_info = {
     'idle'    : "count",
@@ -42,17 +47,99 @@ def writen(out, w_str):
     out.write(w_str + '\n')
 
 def get_keys_ver_map(schedstat_ver):
-    filename = "v" + schedstat_ver + ".json"
-    ver_filename = os.path.join(os.path.dirname(__file__), filename)
+    # The schema of a version is read once and shared, it is never modified
+    if schedstat_ver in keys_ver_map_cache:
+        return keys_ver_map_cache[schedstat_ver]
 
-    if os.path.exists(ver_filename):
-        with open(ver_filename, "r") as json_file:
-            keys_ver_map = json.loads(json_file.read())
-    else:
-        print('Error: Schedstat file not supported : ', tokens[1])
-        return -1
+    with schema_lock:
+        if schedstat_ver in keys_ver_map_cache:
+            return keys_ver_map_cache[schedstat_ver]
+
+        filename = "v" + schedstat_ver + ".json"
+        ver_filename = os.path.join(os.path.dirname(__file__), filename)
+
+        if os.path.exists(ver_filename):
+            with open(ver_filename, "r") as json_file:
+                keys_ver_map = json.loads(json_file.read())
+        else:
+            print('Error: Schedstat file not supported : ', schedstat_ver)
+            return -1
+
+        keys_ver_map_cache[schedstat_ver] = keys_ver_map
+        return keys_ver_map
+
+class ParsePlan:
+    # Everything CPUStats.parse/DomainStats.parse need to know about a
+    # schedstat version: the non-derived keys in input_pos order (the order
+    # of the values on a line), their descriptions and where the values
+    # start on cpu and domain lines (v17 added the domain name).
+    def __init__(self, version, keys_ver_map):
+        self.version = version
+
+        for section in 'cpu', 'domain':
+            only_inbuild_keys = [k for k in keys_ver_map[section + '_keys'] if k['is_derived'] == 0]
+            sorted_keys = sorted(only_inbuild_keys, key=lambda item : item['input_pos'])
+
+            keys = tuple(k['key'] for k in sorted_keys)
+            desc = tuple(k['desc'] for k in sorted_keys)
+            setattr(self, section + '_keys', keys)
+            setattr(self, section + '_desc', desc)
+            setattr(self, section + '_desc_map', dict(zip(keys, desc)))
+
+        self.dname_idx = 1 if int(version) >= 17 else 0
+        self.cpu_values_pos = 1
+        self.domain_values_pos = self.dname_idx + 2
+
+def get_parse_plan(schedstat_ver):
+    if schedstat_ver in parse_plan_cache:
+        return parse_plan_cache[schedstat_ver]
+
+    with schema_lock:
+        if schedstat_ver not in parse_plan_cache:
+            keys_ver_map = get_keys_ver_map(schedstat_ver)
+            if keys_ver_map == -1:
+                return None
+            parse_plan_cache[schedstat_ver] = ParsePlan(schedstat_ver, keys_ver_map)
+
+    return parse_plan_cache[schedstat_ver]
+
+class SchedStatContext:
+    # What a summary is computed and displayed with, besides the snapshots:
+    # the domain map, the CPUs to consider and the cpu stats / domain stats /
+    # domain name filters. A context is not modified once built, so the same
+    # one can be used by any number of threads at once.
+    def __init__(self, domain_map=None, cpuset_str=None, cpu_stats_show_list=None, domain_stats_show_list=None, domains_show_list=None):
+        self.domain_map = dict(domain_map) if domain_map else {}
+        self.cpuset_str = cpuset_str
+        self.cpuset = parse_cpuset(cpuset_str) if cpuset_str else None
+        self.cpu_stats_show_list = tuple(cpu_stats_show_list) if cpu_stats_show_list else None
+        self.domain_stats_show_list = tuple(domain_stats_show_list) if domain_stats_show_list else None
+        self.domains_show_list = tuple(domains_show_list) if domains_show_list else None
+
+    def get_domain_name(self, name):
+        return self.domain_map.get(name, name)
+
+    def get_system_level_desc(self):
+        if self.cpuset:
+            return self.cpuset_str + ' (avg)'
+
+        return 'all_cpus (avg)'
+
+default_context = SchedStatContext()
+
+def split_show_list(show_str):
+    if not show_str:
+        return None
+
+    return list(map(str.strip, show_str.split(',')))
+
+def make_context(domain_map_file=None, cpuset_str=None, cpu_stats_str=None, domain_stats_str=None, domains_str=None):
+    domain_map = None
+    if domain_map_file:
+        domain_map = load_domain_map(domain_map_file)
 
-    return keys_ver_map
+    return SchedStatContext(domain_map, cpuset_str, split_show_list(cpu_stats_str),
+                            split_show_list(domain_stats_str), split_show_list(domains_str))
 
 class Stats:
     def __init__(self, ver='unknown', name=None, timestamp=None):
@@ -69,6 +156,7 @@ class Stats:
         self.version = ver
         self.num_stats = 0
         self.stats_map = {}
+        self.derived_map = {}
 
         if not self.type:
             self.type = 'unknown'
@@ -113,6 +201,20 @@ class Stats:
 
         return 0
 
+    def get_value(self, k):
+        if k['is_derived'] == 0:
+            return self.stats_map[k['key']]
+
+        if k['key'] in self.derived_map:
+            return self.derived_map[k['key']]
+
+        metric = derived_metrics.get_schema_metrics(self.version, get_keys_ver_map(self.version))[self.type + '_keys'][k['key']]
+        func_args = []
+        for args in metric.values:
+            func_args.append(self.stats_map[args])
+
+        return metric.eval(func_args)
+
     def display(self):
         for k in self.stats_map.keys():
             print(k, " : ", self.stats_map[k])
@@ -120,59 +222,35 @@ class Stats:
 class CPUStats(Stats):
     def __init__(self, ver='unknown', name=None, timestamp=None):
         self.type = 'cpu'
+        self.cpu_id = None
         super().__init__(ver, name, timestamp)
 
     def parse(self, line):
+        plan = get_parse_plan(self.version)
         tokens = line.split()
         self.name = tokens[0]
-        cpu_values = list(map(int,tokens[1:len(tokens)]))
-        keys_array = []
-        desc_array = []
-        only_inbuild_keys = []
-
-        for k in keys_ver_map['cpu_keys']:
-            if k['is_derived'] == 0:
-                only_inbuild_keys.append(k)
-
-        sorted_cpu_list = sorted(only_inbuild_keys, key=lambda item : item['input_pos'])
-
-        for s in sorted_cpu_list:
-            keys_array.append(s['key'])
-            desc_array.append(s['desc'])
-
-        super().parse(keys_array, desc_array, cpu_values)
+        self.cpu_id = int(self.name[3:])
+        self.stats_map = dict(zip(plan.cpu_keys, map(int, tokens[plan.cpu_values_pos:])))
+        self.desc_map = plan.cpu_desc_map
 
     def get_desc(self, key):
         return self.desc_map[key]
 
     def checkCPUId(self, cpuid):
-        num = int(self.name.split('u')[1])
-
-        if num == cpuid:
-            return True
-
-        return False
+        return self.cpu_id == cpuid
 
-    def displayCategories(self, out):
+    def displayCategories(self, out, ctx=default_context):
         writen(out, banner_width * "-")
         writen(out, "cpu:  " + self.name,)
         writen(out, banner_width * "-")
 
-        for k in keys_ver_map['cpu_keys']:
-            if cpu_stats_show_list:
-                templist = [x for x in cpu_stats_show_list if k['key'].find(x) != -1]
+        for k in get_keys_ver_map(self.version)['cpu_keys']:
+            if ctx.cpu_stats_show_list:
+                templist = [x for x in ctx.cpu_stats_show_list if k['key'].find(x) != -1]
                 if (len(templist) == 0):
                     continue
 
-            if k['is_derived'] == 0:
-                v = self.stats_map[k['key']]
-            else:
-                func_args = []
-                for args in k['values']:
-                    func_args.append(self.stats_map[args])
-
-                fn = lambda a: eval(k['function'])
-                v = fn(func_args)
+            v = self.get_value(k)
 
             p_str = ''
             p_str += k['desc'] + ' : ' + f"{v:20d}"
@@ -190,30 +268,12 @@ class DomainStats(Stats):
         super().__init__(ver, name, timestamp)
 
     def parse(self, line):
+        plan = get_parse_plan(self.version)
         tokens = line.split()
-
-        dname_idx = 0
-        if int(self.version) >= 17:
-            dname_idx = 1
-
-        self.name = tokens[dname_idx + 0]
-        self.cpumask = tokens[dname_idx + 1]
-        domain_values = list(map(int, tokens[dname_idx + 2 : len(tokens)]))
-        keys_array = []
-        desc_array = []
-        only_inbuild_keys = []
-
-        for k in keys_ver_map['domain_keys']:
-            if k['is_derived'] == 0:
-                only_inbuild_keys.append(k)
-
-        sorted_domain_set = sorted(only_inbuild_keys, key=lambda item : item['input_pos'])
-
-        for s in sorted_domain_set:
-            keys_array.append(s['key'])
-            desc_array.append(s['desc'])
-
-        super().parse(keys_array, desc_array, domain_values)
+        self.name = tokens[plan.dname_idx]
+        self.cpumask = tokens[plan.dname_idx + 1]
+        self.stats_map = dict(zip(plan.domain_keys, map(int, tokens[plan.domain_values_pos:])))
+        self.desc_map = plan.domain_desc_map
 
     def get_desc(self, key):
         return self.desc_map[key]
@@ -282,14 +342,11 @@ class DomainStats(Stats):
 
         return str(interval_list)
 
-    def displayCategories(self, out, cmp_data_1=None, cmp_data_2=None, cmp_data_3=None):
-        domain_name = self.name
+    def displayCategories(self, out, cmp_data_1=None, cmp_data_2=None, cmp_data_3=None, ctx=default_context):
+        domain_name = ctx.get_domain_name(self.name)
 
-        if domain_name in domain_map:
-            domain_name = domain_map[domain_name]
-
-        if domains_show_list:
-            templist = [x for x in domains_show_list if domain_name.find(x) != -1]
+        if ctx.domains_show_list:
+            templist = [x for x in ctx.domains_show_list if domain_name.find(x) != -1]
             if (len(templist) == 0):
                 return
 
@@ -303,22 +360,15 @@ class DomainStats(Stats):
         writen(out, banner_width * "-")
         last_cat = ''
 
-        for k in keys_ver_map['domain_keys']:
-            if domain_stats_show_list:
-                templist = [x for x in domain_stats_show_list if k['key'].find(x) != -1]
+        for k in get_keys_ver_map(self.version)['domain_keys']:
+            if ctx.domain_stats_show_list:
+                templist = [x for x in ctx.domain_stats_show_list if k['key'].find(x) != -1]
                 if (len(templist) == 0):
                     continue
 
             drop_stats = False
 
-            if k['is_derived'] == 0:
-                v = self.stats_map[k['key']]
-            else:
-                func_args = []
-                for args in k['values']:
-                    func_args.append(self.stats_map[args])
-                fn = lambda a: eval(k['function'])
-                v = fn(func_args)
+            v = self.get_value(k)
 
             category = k['key'].split('_')[0]
 
@@ -408,7 +458,7 @@ class SchedStatNode:
             domain_node.calculate_category_totals()
             self.inter_domain_lb_count += domain_node.domain_lb_count
 
-    def print_node_info(self, out):
+    def print_node_info(self, out, ctx=default_context):
         total_wakeup = self.cpu_info.stats_map['ttwu_count']
         writen(out, "< " + int((banner_width - 20) / 2) * "-" + "  Wakeup info:  " + int((banner_width - 20) / 2) * "-" +  " >")
         val = self.cpu_info.stats_map['l_ttwu_count']
@@ -417,9 +467,7 @@ class SchedStatNode:
         writen(out, 'Wakeups on same         ' + f"{name:>10s}" + " \t:  " + f"{val:20d}" + ' \t(  ' + f"{p1:8.5f}" + '  )')
 
         for domain_node in self.domain_info_list:
-            name = domain_node.name
-            if name in domain_map:
-                name = domain_map[name]
+            name = ctx.get_domain_name(domain_node.name)
 
             val = domain_node.stats_map['ttwu_awoke_task_dcsd']
             p1 = percentage(val, total_wakeup)
@@ -428,27 +476,24 @@ class SchedStatNode:
         writen(out, '')
 
         for domain_node in self.domain_info_list:
-            name = domain_node.name
-
-            if name in domain_map:
-                name = domain_map[name]
+            name = ctx.get_domain_name(domain_node.name)
 
             val = domain_node.stats_map['ttwu_mv_task_cc']
             p1 = percentage(val, total_wakeup)
             writen(out, 'Affine wakeups on same  ' + f"{name:>10s}" + " \t:  " + f"{val:20d}" + ' \t(  ' + f"{p1:8.5f}" + '  )')
 
-    def displayCategories(self, out, extra_param=None):
+    def displayCategories(self, out, extra_param=None, ctx=default_context):
         next_paren = '<>'
 
         if not extra_param:
             next_paren = '[]'
 
-        self.cpu_info.displayCategories(out)
+        self.cpu_info.displayCategories(out, ctx)
 
         for domain_node in self.domain_info_list:
-            domain_node.displayCategories(out, (next_paren, self.inter_domain_lb_count), extra_param)
+            domain_node.displayCategories(out, (next_paren, self.inter_domain_lb_count), extra_param, ctx=ctx)
 
-        self.print_node_info(out)
+        self.print_node_info(out, ctx)
 
     def add(self, b):
         self.cpu_info.add(b.cpu_info)
@@ -474,71 +519,105 @@ class SchedStatNode:
 
         return 0
 
+def split_cpu_blocks(lines, chunks):
+    # Split lines in up to chunks parts, each starting with a cpu line
+    starts = [i for i, line in enumerate(lines) if line.startswith('cpu')]
+    chunks = max(1, min(chunks, len(starts)))
+    bounds = [starts[int(c * len(starts) / chunks)] for c in range(chunks)] + [len(lines)]
+
+    return [lines[bounds[c]:bounds[c + 1]] for c in range(chunks) if bounds[c] < bounds[c + 1]]
+
+def parse_node_lines(version, timestamp, lines):
+    # Nodes of a block of cpu/domain lines. Also runs in the pool workers
+    # of SchedStatNodes.parse().
+    nodes = []
+
+    for line in lines:
+        if line.startswith('cpu'):
+            node = SchedStatNode(version)
+            node.addCPUInfo(line, timestamp)
+            nodes.append(node)
+        else:
+            nodes[-1].addDomainInfo(line, timestamp)
+
+    return nodes
+
 class SchedStatNodes:
     def __init__(self, name=None):
         if name:
             self.name = name
 
         self.sched_nodes = []
+        self.cpu_index = {}
         self.version = 'unknown'
 
-    def parse(self, file_path):
-        global keys_ver_map
-        sched_file = open(file_path, 'r')
-        curr_node = -1
-
-        for line in sched_file:
-            tokens = line.split()
-
-            if tokens[0].startswith('version'):
-                keys_ver_map = get_keys_ver_map(tokens[1].strip())
-                self.version = tokens[1]
-
-            elif tokens[0].startswith('timestamp'):
-                self.timestamp = int(tokens[1])
+    def parse(self, file_path, pool=None, chunks=1):
+        # With a process pool, the cpu/domain lines are split in chunks of
+        # whole CPU blocks which are parsed by the workers
+        body = []
 
-            elif tokens[0].startswith('cpu'):
-                if self.version == 'unknown':
-                    print('Error: version info missing')
-                    return -1
+        with open(file_path, 'r') as sched_file:
+            for line in sched_file:
+                tokens = line.split(maxsplit=2)
+                if not tokens:
+                    continue
 
-                curr_node += 1
-                node = SchedStatNode(self.version)
-                self.sched_nodes.append(node)
-                self.sched_nodes[curr_node].addCPUInfo(line, self.timestamp)
+                if tokens[0].startswith('version'):
+                    if get_parse_plan(tokens[1].strip()) is None:
+                        return -1
+                    self.version = tokens[1]
+
+                elif tokens[0].startswith('timestamp'):
+                    self.timestamp = int(tokens[1])
+
+                elif tokens[0].startswith('cpu') or tokens[0].startswith('domain'):
+                    if self.version == 'unknown':
+                        print('Error: version info missing')
+                        return -1
+                    if not body and tokens[0].startswith('domain'):
+                        print("Error: invalid node number")
+                        return -1
+                    body.append(line)
+
+        blocks = split_cpu_blocks(body, chunks)
+
+        if pool and len(blocks) > 1:
+            results = [pool.submit(parse_node_lines, self.version, self.timestamp, b) for b in blocks]
+            for r in results:
+                self.sched_nodes += r.result()
+        else:
+            for b in blocks:
+                self.sched_nodes += parse_node_lines(self.version, self.timestamp, b)
 
-            elif tokens[0].startswith('domain'):
-                if self.version == 'unknown':
-                    print('Error: version info missing')
-                    return -1
-                if curr_node < 0:
-                    print("Error: invalid node number")
-                    return -1
-                self.sched_nodes[curr_node].addDomainInfo(line, self.timestamp)
+        for node in self.sched_nodes:
+            # First node wins for duplicate ids, as with the linear scan
+            self.cpu_index.setdefault(node.cpu_info.cpu_id, node)
 
         return 0
 
     def getNodeByCPUId(self, cpuid):
-        for n in self.sched_nodes:
-            if n.checkCPUId(cpuid):
-                return n
+        return self.cpu_index.get(cpuid)
 
-        return None
+    def select(self, cpuset=None):
+        if not cpuset:
+            return self.sched_nodes
 
-    def calculate_node_totals(self, cpuset=None):
-        self.inter_nodes_lb_count = 0
+        nodes = []
+        for i in cpuset:
+            n = self.cpu_index.get(i)
 
-        if cpuset:
-            self.nodes_to_consider = []
+            if n != None:
+                nodes.append(n)
 
-            for i in cpuset:
-                n = self.getNodeByCPUId(i)
+        return nodes
 
-                if n != None:
-                    self.nodes_to_consider.append(n)
+    def calculate_node_totals(self, cpuset=None, nodes_to_consider=None):
+        self.inter_nodes_lb_count = 0
 
-        else:
-            self.nodes_to_consider = self.sched_nodes
+        if nodes_to_consider is None:
+            nodes_to_consider = self.select(cpuset)
+
+        self.nodes_to_consider = nodes_to_consider
 
         for node in self.nodes_to_consider:
             node.calculate_domain_totals()
@@ -548,9 +627,9 @@ class SchedStatNodes:
         for node in self.sched_nodes:
             node.display()
 
-    def displayCategories(self, out):
+    def displayCategories(self, out, ctx=default_context):
         for node in self.nodes_to_consider:
-            node.displayCategories(out)
+            node.displayCategories(out, ctx=ctx)
 
     def add(self, b):
         if len(self.sched_nodes) != len(b.sched_nodes):
@@ -587,161 +666,348 @@ def parse_cpuset(cpuset):
 
     return cs
 
-def main(before_file, after_file, out_file, domain_map_file=None, cpuset_str=None, cpu_stats_str=None, domain_stats_str=None, domains_str=None, list_cpustats=None, list_domainstats=None, schedstats_ver=None):
-    global cpu_stats_show_list
-    global domain_stats_show_list
-    global domains_show_list
+def make_matrix_cpu_stats(matrix, name, values, derived=None):
+    cpu_info = CPUStats(matrix.version, name, matrix.timestamp)
+    cpu_info.stats_map = dict(zip(matrix.cpu_keys, values))
+    cpu_info.desc_map = dict(zip(matrix.cpu_keys, matrix.cpu_desc))
+    if derived:
+        cpu_info.derived_map = derived
+    return cpu_info
+
+def make_matrix_domain_stats(matrix, name, cpumask, values, lb_counts, derived=None):
+    # lb_counts are the values of the matrix.category_cols columns, in order
+    domain_info = DomainStats(matrix.version, name, matrix.timestamp)
+    domain_info.cpumask = cpumask
+    domain_info.stats_map = dict(zip(matrix.domain_keys, values))
+    domain_info.desc_map = dict(zip(matrix.domain_keys, matrix.domain_desc))
+    if derived:
+        domain_info.derived_map = derived
+    domain_info.category_lb_count = dict(zip(matrix.category_cols.keys(), lb_counts))
+    domain_info.domain_lb_count = sum(lb_counts)
+    return domain_info
+
+def get_matrix_node(matrix, row):
+    node = SchedStatNode(matrix.version)
+    cpu_derived = {k: v[row].item() for k, v in matrix.cpu_derived.items()}
+    node.cpu_info = make_matrix_cpu_stats(matrix, matrix.cpu_names[row], matrix.cpu_data[row].tolist(), cpu_derived)
+    node.inter_domain_lb_count = int(matrix.inter_domain_lb_count[row])
+
+    lb_counts = matrix.category_lb_count[row].tolist()
+    domain_values = matrix.domain_data[row].tolist()
+    domain_derived = {k: v[row].tolist() for k, v in matrix.domain_derived.items()}
+
+    for i in range(int(matrix.num_domains[row])):
+        derived = {k: v[i] for k, v in domain_derived.items()}
+        domain_info = make_matrix_domain_stats(matrix, matrix.domain_names[row][i], matrix.cpumasks[row][i],
+                                               domain_values[i], lb_counts[i], derived)
+        node.domain_info_list.append(domain_info)
+
+    return node
+
+def get_matrix_average_node(matrix, rows, system_level_desc_str, ctx=default_context):
+    cpu_avg, domain_avg = matrix.average(rows)
+    cols = list(matrix.category_cols.values())
 
-    if list_cpustats:
-        if not schedstat_ver:
-            print("Error: Passing of schedstat version is must with -v option to list cpustat fileds")
-            exit(1)
+    system_level_node = SchedStatNode('system_level_node')
+    system_level_node.cpu_info = make_matrix_cpu_stats(matrix, system_level_desc_str, cpu_avg)
+    system_level_node.inter_domain_lb_count = 0
 
-        temp_key_ver_map = get_key_ver_map(schedstat_ver)
-
-        print(banner_width*"-")
-        print("Cpu Stats List")
-        print(banner_width*"-")
-        for k in keys_ver_map['cpu_keys']:
-            if k['is_derived'] == 0:
-                key_desc = "%-30s:%s" %(k['key'], k['desc'])
-                print(key_desc)
-
-        print(banner_width*"-")
-        print("Derived CPU stats list")
-        print(banner_width*"-")
-        for k in keys_ver_map['cpu_keys']:
-            if k['is_derived'] == 1:
-                key_desc = "%-30s:%s" %(k['key'], k['desc'])
-                print(key_desc)
-        exit(0)
+    # Domain levels of the system level node follow the first CPU
+    for i in range(int(matrix.num_domains[0])):
+        d_name = ctx.get_domain_name(matrix.domain_names[0][i])
 
-    if list_domainstats:
-        if not schedstat_ver:
-            print("Error: Passing of schedstat version is must with -v option to list domainstat fileds")
-            exit(1)
+        lb_counts = [domain_avg[i][c] for c in cols]
+        new_domain = make_matrix_domain_stats(matrix, d_name + ' cpus = ' + system_level_desc_str, '0', domain_avg[i], lb_counts)
+        system_level_node.domain_info_list.append(new_domain)
+        system_level_node.inter_domain_lb_count += new_domain.domain_lb_count
 
-        temp_key_ver_map = get_key_ver_map(schedstat_ver)
-
-        print(banner_width*"-")
-        print("Domain stats list")
-        print(banner_width*"-")
-        for k in keys_ver_map['domain_keys']:
-            if k['is_derived'] == 0:
-                key_desc = "%-30s:%s" %(k['key'], k['desc'])
-                print(key_desc)
-
-        print(banner_width*"-")
-        print("Derived domain stats list")
-        print(banner_width*"-")
-        for k in keys_ver_map['domain_keys']:
-            if k['is_derived'] == 1:
-                key_desc = "%-30s:%s" %(k['key'], k['desc'])
-                print(key_desc)
-        exit(0)
+    return system_level_node
 
-    if not before_file or not after_file:
-        print("Error: Need at least 2 schedstat files")
-        exit(1)
+def get_nodes_average_node(sched_nodes, nodes_to_consider, system_level_desc_str, ctx=default_context):
+    system_level_node = SchedStatNode('system_level_node')
+    system_level_node.cpu_info = CPUStats(sched_nodes.sched_nodes[0].cpu_info.version, system_level_desc_str)
+    system_level_node.cpu_info.copy_keys(sched_nodes.sched_nodes[0].cpu_info)
 
-    if domain_map_file:
-        domain_map_path = domain_map_file
-        for line in open(domain_map_path):
-            tokens = line.split(':')
-            domain_map[tokens[0]] = tokens[1].strip()
+    for d in sched_nodes.sched_nodes[0].domain_info_list:
+        d_name = ctx.get_domain_name(d.name)
 
-    cpuset = None
-    if cpuset_str:
-        cpuset = parse_cpuset(cpuset_str)
+        new_domain = DomainStats(d.version, d_name + ' cpus = ' + system_level_desc_str)
+        new_domain.copy_keys(d)
+        system_level_node.domain_info_list.append(new_domain)
 
-    if cpu_stats_str:
-        cpu_stats_show_list = cpu_stats_str.split(',')
+    for node in nodes_to_consider:
+        system_level_node.cpu_info.add(node.cpu_info)
 
-    if domain_stats_str:
-        domain_stats_show_list = domain_stats_str.split(',')
+        for i in range(0, len(node.domain_info_list)):
+            domain = node.domain_info_list[i]
+            system_level_node.domain_info_list[i].add(domain)
 
-    if (out_file != ""):
-        out_file_p = open(out_file, "w")
-    else:
-        out_file_p = sys.stdout
+    system_level_node.cpu_info.scaler_div(len(nodes_to_consider))
 
-    file1 = before_file
-    file1_nodes = SchedStatNodes('file1')
-    file1_nodes.parse(file1)
+    for i in range(0, len(system_level_node.domain_info_list)):
+        system_level_node.domain_info_list[i].scaler_div(len(nodes_to_consider))
 
-    file2 = after_file
-    file2_nodes = SchedStatNodes('file2')
-    file2_nodes.parse(file2)
+    system_level_node.calculate_domain_totals()
 
-    file2_nodes.subtract(file1_nodes)
+    return system_level_node
 
-    if cpuset:
-        nodes_to_consider = []
+def matrix_summary(matrix, cpuset, system_level_desc_str, ctx=default_context, nodes=True):
+    # With nodes=False, the CPU nodes are left to the caller to materialize
+    rows = matrix.select(cpuset)
+    matrix.calculate_node_totals(rows)
+    matrix.calculate_derived()
 
-        for i in cpuset:
-            n = file2_nodes.getNodeByCPUId(i)
+    system_level_node = get_matrix_average_node(matrix, rows, system_level_desc_str, ctx)
+    nodes_to_consider = []
+    if nodes:
+        nodes_to_consider = [get_matrix_node(matrix, row) for row in rows]
 
-            if n != None:
-                nodes_to_consider.append(n)
-    else:
-        nodes_to_consider = file2_nodes.sched_nodes
+    return (system_level_node, nodes_to_consider)
 
-    if cpu_stats_str:
-        cpu_stats_show_list = list(map(str.strip, cpu_stats_str.split(',')))
+def get_snapshot_path(log_dir, name):
+    # <log_dir>/<name>, or <log_dir>/<name>.bin for a run captured with -B
+    path = os.path.join(log_dir, name)
+    if not os.path.exists(path) and os.path.exists(path + '.bin'):
+        return path + '.bin'
 
-    if domain_stats_str:
-        domain_stats_show_list = list(map(str.strip, domain_stats_str.split(',')))
+    return path
 
-    if domains_str:
-        domains_show_list = list(map(str.strip, domains_str.split(',')))
+def load_nodes(file_path, name=None, pool=None, chunks=1):
+    nodes = SchedStatNodes(name)
+    if nodes.parse(file_path, pool, chunks) != 0:
+        return None
 
-    system_level_desc_str = 'all_cpus (avg)'
-    if cpuset:
-        system_level_desc_str = cpuset_str + ' (avg)'
+    return nodes
 
-    system_level_node = SchedStatNode('system_level_node')
-    system_level_node.cpu_info = CPUStats(file2_nodes.sched_nodes[0].cpu_info.version, system_level_desc_str)
-    system_level_node.cpu_info.copy_keys(file2_nodes.sched_nodes[0].cpu_info)
+def load_matrix(file_path, name=None):
+    import schedstat_matrix
 
-    for d in file2_nodes.sched_nodes[0].domain_info_list:
-        d_name = d.name
+    matrix = schedstat_matrix.SchedStatMatrix(name)
+    if matrix.parse(file_path) != 0:
+        return None
 
-        if d_name in domain_map:
-            d_name = domain_map[d_name]
+    return matrix
 
-        new_domain = DomainStats(d.version, d_name + ' cpus = ' + system_level_desc_str)
-        new_domain.copy_keys(d)
-        system_level_node.domain_info_list.append(new_domain)
+def load_matrices(before_file, after_file, pool=None):
+    # Both files are parsed concurrently when a process pool is given
+    if pool:
+        results = [pool.submit(load_matrix, before_file, 'file1'), pool.submit(load_matrix, after_file, 'file2')]
+        return tuple(r.result() for r in results)
 
-    for node in nodes_to_consider:
-        system_level_node.cpu_info.add(node.cpu_info)
+    return (load_matrix(before_file, 'file1'), load_matrix(after_file, 'file2'))
 
-        for i in range(0, len(node.domain_info_list)):
-            domain = node.domain_info_list[i]
-            system_level_node.domain_info_list[i].add(domain)
+def load_delta_matrix(before_file, after_file, pool=None):
+    (file1_matrix, file2_matrix) = load_matrices(before_file, after_file, pool)
 
-    system_level_node.cpu_info.scaler_div(len(nodes_to_consider))
+    if file1_matrix is None or file2_matrix is None:
+        return None
 
-    for i in range(0, len(system_level_node.domain_info_list)):
-        system_level_node.domain_info_list[i].scaler_div(len(nodes_to_consider))
+    if file2_matrix.subtract(file1_matrix) != 0:
+        return None
 
-    system_level_node.calculate_domain_totals()
-    file2_nodes.calculate_node_totals(cpuset)
+    return file2_matrix
+
+class SchedStatSummary:
+    # Result of summarize(). delta is the SchedStatMatrix of the deltas and
+    # rows the CPUs to consider in it, with the columnar model only. Their
+    # nodes are only built when first needed.
+    def __init__(self, ctx, time_elapsed, system_level_node, nodes_to_consider, delta=None, rows=None):
+        self.ctx = ctx
+        self.time_elapsed = time_elapsed
+        self.system_level_node = system_level_node
+        self.nodes_to_consider = nodes_to_consider
+        self.delta = delta
+        self.rows = rows
+
+    def get_nodes(self):
+        if self.nodes_to_consider is None:
+            self.nodes_to_consider = [get_matrix_node(self.delta, row) for row in self.rows]
+
+        return self.nodes_to_consider
+
+    def write(self, out_file_p):
+        write_summary(out_file_p, self.time_elapsed, self.system_level_node, self.get_nodes(), self.ctx)
+
+def summarize(before_file, after_file, ctx=default_context, columnar=False, pool=None, chunks=1, prof=phase_profile.disabled):
+    # Summary of the before/after snapshots of one run. Nothing but the
+    # returned objects is modified, so runs can be summarized from several
+    # threads, each with its own context or sharing one.
+    desc = ctx.get_system_level_desc()
+
+    if not columnar:
+        import schedstat_matrix
+
+        # Binary snapshots are only read through the columnar model
+        columnar = schedstat_matrix.is_binary(before_file) or schedstat_matrix.is_binary(after_file)
+
+    # The snapshots are read and parsed in the same pass
+    with prof.phase('parse') as counts:
+        if columnar:
+            (file1, file2) = load_matrices(before_file, after_file, pool)
+        else:
+            (file1, file2) = (load_nodes(before_file, 'file1', pool, chunks), load_nodes(after_file, 'file2', pool, chunks))
+
+        if file1 is None or file2 is None:
+            return None
+
+        counts['cpus'] = len(file2.cpu_index)
+
+    with prof.phase('diff'):
+        time_elapsed = file2.timestamp - file1.timestamp
+        if file2.subtract(file1) != 0:
+            return None
 
+    with prof.phase('derive') as counts:
+        if columnar:
+            (system_level_node, nodes_to_consider) = matrix_summary(file2, ctx.cpuset, desc, ctx, False)
+            rows = file2.select(ctx.cpuset)
+            counts['cpus'] = len(rows)
+            return SchedStatSummary(ctx, time_elapsed, system_level_node, None, file2, rows)
+
+        nodes_to_consider = file2.select(ctx.cpuset)
+        system_level_node = get_nodes_average_node(file2, nodes_to_consider, desc, ctx)
+        file2.calculate_node_totals(ctx.cpuset, nodes_to_consider)
+        counts['cpus'] = len(nodes_to_consider)
+
+    return SchedStatSummary(ctx, time_elapsed, system_level_node, nodes_to_consider)
+
+def load_domain_map(domain_map_file):
+    domain_map = {}
+
+    with open(domain_map_file) as map_file:
+        for line in map_file:
+            tokens = line.split(':')
+            domain_map[tokens[0]] = tokens[1].strip()
+
+    return domain_map
+
+def write_summary(out_file_p, time_elapsed, system_level_node, nodes_to_consider, ctx=default_context):
     writen(out_file_p, help_text)
     writen(out_file_p, banner_width * "-")
     writen(out_file_p, "System level info:")
     writen(out_file_p, banner_width * "-")
-    time_elapsed = "%21s" %(str(file2_nodes.timestamp - file1_nodes.timestamp))
+    time_elapsed = "%21s" %(str(time_elapsed))
     writen(out_file_p, "Time elapsed (in jiffies)                                  :" + time_elapsed)
 
-    system_level_node.displayCategories(out_file_p)
+    system_level_node.displayCategories(out_file_p, ctx=ctx)
 
     writen(out_file_p, banner_width * "-")
     writen(out_file_p, "CPU level info:")
     writen(out_file_p, banner_width * "-")
 
-    file2_nodes.displayCategories(out_file_p)
+    for node in nodes_to_consider:
+        node.displayCategories(out_file_p, ctx=ctx)
+
+def list_stats(schedstat_ver, section, title, derived_title):
+    keys_ver_map = get_keys_ver_map(str(schedstat_ver))
+    if keys_ver_map == -1:
+        exit(1)
+
+    print(banner_width*"-")
+    print(title)
+    print(banner_width*"-")
+    for k in keys_ver_map[section]:
+        if k['is_derived'] == 0:
+            key_desc = "%-30s:%s" %(k['key'], k['desc'])
+            print(key_desc)
+
+    print(banner_width*"-")
+    print(derived_title)
+    print(banner_width*"-")
+    for k in keys_ver_map[section]:
+        if k['is_derived'] == 1:
+            key_desc = "%-30s:%s" %(k['key'], k['desc'])
+            print(key_desc)
+
+def main(before_file, after_file, out_file, domain_map_file=None, cpuset_str=None, cpu_stats_str=None, domain_stats_str=None, domains_str=None, list_cpustats=None, list_domainstats=None, schedstat_ver=None, columnar=False, export_file=None, topology_file=None, jobs=1, rank_count=None, rank_metrics=None, rank_method='zscore', profile=False):
+    if list_cpustats:
+        if not schedstat_ver:
+            print("Error: Passing of schedstat version is must with -v option to list cpustat fileds")
+            exit(1)
+
+        list_stats(schedstat_ver, 'cpu_keys', "Cpu Stats List", "Derived CPU stats list")
+        exit(0)
+
+    if list_domainstats:
+        if not schedstat_ver:
+            print("Error: Passing of schedstat version is must with -v option to list domainstat fileds")
+            exit(1)
+
+        list_stats(schedstat_ver, 'domain_keys', "Domain stats list", "Derived domain stats list")
+        exit(0)
+
+    if not before_file or not after_file:
+        print("Error: Need at least 2 schedstat files")
+        exit(1)
+
+    ctx = make_context(domain_map_file, cpuset_str, cpu_stats_str, domain_stats_str, domains_str)
+    prof = phase_profile.PhaseProfile('schedstat_parser', profile)
+
+    if (out_file != ""):
+        out_file_p = open(out_file, "w")
+    else:
+        out_file_p = sys.stdout
+
+    pool = None
+    if jobs and jobs > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(jobs)
+
+    # The export, the topology rollups and the ranking are computed from the
+    # delta matrix
+    columnar = columnar or bool(export_file or topology_file or rank_count)
+    summary = summarize(before_file, after_file, ctx, columnar, pool, jobs, prof)
+
+    if pool:
+        pool.shutdown()
+
+    if summary is None:
+        exit(1)
+
+    if export_file:
+        import schedstat_export
+        with prof.phase('export') as counts:
+            schedstat_export.export(export_file, summary.delta, summary.rows, ctx.get_system_level_desc(), ctx.domain_map)
+            counts['cpus'] = len(summary.rows)
+
+    if topology_file:
+        import schedstat_topology
+        with prof.phase('topology') as counts:
+            rollup = schedstat_topology.TopologyRollup(summary.delta, summary.rows)
+            with open(topology_file, "w") as topology_file_p:
+                schedstat_topology.write_topology(topology_file_p, rollup, ctx.domain_map)
+            counts['spans'] = sum(len(level_spans) for level_spans in rollup.spans)
+
+    out = io.StringIO()
+
+    if rank_count:
+        import schedstat_rank
+        if rank_method not in schedstat_rank.rank_methods:
+            print('Error: unknown ranking method ', rank_method)
+            exit(1)
+
+        with prof.phase('rank') as counts:
+            metrics = split_show_list(rank_metrics or schedstat_rank.default_rank_metrics)
+            outliers = schedstat_rank.rank(summary.delta, summary.rows, metrics, rank_method, rank_count)
+            if outliers is None:
+                exit(1)
+
+            # Only the nodes of the outliers are built
+            summary.nodes_to_consider = [get_matrix_node(summary.delta, row) for row in schedstat_rank.get_outlier_rows(outliers)]
+            counts['cpus'] = len(summary.rows)
+
+        schedstat_rank.write_outliers(out, summary.delta, outliers, rank_method, ctx)
+
+    with prof.phase('render') as counts:
+        summary.write(out)
+        counts['cpus'] = len(summary.get_nodes())
+
+    with prof.phase('write') as counts:
+        text = out.getvalue()
+        out_file_p.write(text)
+        counts['bytes'] = len(text)
+
+    if profile:
+        prof.write(os.path.dirname(os.path.abspath(out_file or after_file)))
 
 if __name__ == "__main__":
     parser = OptionParser()
@@ -756,7 +1022,15 @@ if __name__ == "__main__":
     parser.add_option("-C", "--list-cpustats", dest="list_cpustats", action="store_true", default=False,  help="list of available cpu statistics (Passing schedstat version is must)")
     parser.add_option("-D", "--list-domainstats", dest="list_domainstats", action="store_true", default=False,  help="list of available domainstats (Passing schedstat version is must)")
     parser.add_option("-v", "--schedstat-version", dest="schedstat_ver", type=int, help="schedstat version")
+    parser.add_option("-M", "--columnar", dest="columnar", action="store_true", default=False, help="Use the columnar (numpy) snapshot model to compute the deltas and averages")
+    parser.add_option("-x", "--export", dest="export_file", type=str, help="Also export the summary as structured data: .npz archive if the name ends with .npz, JSON Lines otherwise")
+    parser.add_option("-j", "--jobs", dest="jobs", type=int, default=1, help="Number of worker processes used to parse the snapshots. Default: 1")
+    parser.add_option("-k", "--top", dest="rank_count", type=int, help="Rank the CPUs and domains of the cpulist by how much they deviate from the mean/median of the cpulist and only show the top given number of them")
+    parser.add_option("-m", "--rank-metrics", dest="rank_metrics", type=str, help="Comma separated list of cpu stats, domain stats or lb_count/lb_failed/pull_task/wakeups/affine to rank on with -k. Default: lb_failed,wait_time,ttwu_count")
+    parser.add_option("-r", "--rank-method", dest="rank_method", type=str, default="zscore", help="Score of a value with -k: zscore (against the mean of the CPUs, or same-level domains, of the cpulist) or median (ratio to the median of the CPUs, or same-level domains, of the cpulist). Default: zscore")
+    parser.add_option("-P", "--profile", dest="profile", action="store_true", default=False, help="Write the time, CPU time, peak RSS and item counts of every phase to schedstat_parser.profile.json, next to the output file")
+    parser.add_option("-T", "--topology", dest="topology_file", type=str, help="Also write the load balancing and wakeup totals of every domain span (SMT, MC, NUMA...) as a hierarchy to this file")
 
     (options, args) = parser.parse_args()
 
-    main(options.before_file, options.after_file, options.out_file, options.domain_map_file, options.cpu_list, options.cpu_stats_str, options.domain_stats_str, options.domains_str, options.list_cpustats, options.list_domainstats, options.schedstat_ver)
+    main(options.before_file, options.after_file, options.out_file, options.domain_map_file, options.cpu_list, options.cpu_stats_str, options.domain_stats_str, options.domains_str, options.list_cpustats, options.list_domainstats, options.schedstat_ver, options.columnar, options.export_file, options.topology_file, options.jobs, options.rank_count, options.rank_metrics, options.rank_method, options.profile)
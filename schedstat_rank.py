@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Outlier ranking of the CPUs and domains of a schedstat delta.
+#
+# Every metric is scored against its fleet: a cpu key against the same key
+# on every CPU of the cpuset, a domain key (or one of the lb_count,
+# lb_failed, pull_task, wakeups, affine groups of schedstat_topology)
+# against the same key on the domains of the same level. The score is
+# either the z-score or the ratio to the median of the fleet. When that
+# median is 0, a ratio is meaningless: the score is then the deviation from
+# the median over the median absolute deviation (MAD), or over the mean of
+# the nonzero absolute deviations when the MAD is 0 too. All the
+# scores of all the metrics go in one array and only the count entries
+# deviating the most are picked with np.argpartition, so only those are
+# sorted and rendered.
+
+import numpy as np
+import schedstat_parser
+import schedstat_topology
+
+rank_methods = ['zscore', 'median']
+default_rank_metrics = 'lb_failed,wait_time,ttwu_count'
+
+class Outlier:
+    def __init__(self, metric, row, level, value, center, score, deviation, scaled=False):
+        self.metric = metric
+        self.row = row
+        # Domain level, None for cpu metrics
+        self.level = level
+        self.value = value
+        # Mean or median of the fleet
+        self.center = center
+        self.score = score
+        self.deviation = deviation
+        # Score scaled by the MAD, the median of the fleet being 0
+        self.scaled = scaled
+
+def top_rows(column, count, tie=None):
+    # Indices of the count largest values of column, largest first, ties
+    # broken on the largest tie value
+    count = min(count, len(column))
+    if count == 0:
+        return []
+
+    if tie is None:
+        top = np.argpartition(column, len(column) - count)[len(column) - count:]
+        return top[np.argsort(-column[top], kind='stable')]
+
+    # Every entry tied with the last one picked is a candidate
+    kth = np.partition(column, len(column) - count)[len(column) - count]
+    top = np.flatnonzero(column >= kth)
+    return top[np.lexsort((-tie[top], -column[top]))[:count]]
+
+def get_metric(matrix, metric):
+    # (values, is_domain): rows or rows x domains values of metric. Derived
+    # keys need matrix.calculate_derived() to have run.
+    if metric in matrix.cpu_col:
+        return (matrix.cpu_data[:, matrix.cpu_col[metric]], False)
+
+    if metric in matrix.cpu_derived:
+        return (matrix.cpu_derived[metric], False)
+
+    if metric in matrix.domain_col:
+        return (matrix.domain_data[:, :, matrix.domain_col[metric]], True)
+
+    if metric in matrix.domain_derived:
+        return (matrix.domain_derived[metric], True)
+
+    if metric in schedstat_topology.rollup_domain_keys:
+        cols = [matrix.domain_col[k] for k in schedstat_topology.rollup_domain_keys[metric] if k in matrix.domain_col]
+        return (matrix.domain_data[:, :, cols].sum(axis=2), True)
+
+    return (None, False)
+
+def get_scores(values, method):
+    # (center, scores, deviations, scaled) of every value of the fleet,
+    # scaled when the scores are deviations over the MAD
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'median':
+            center = np.median(values)
+            if center != 0:
+                scores = np.where(values == center, 1.0, values / center)
+                return (center, scores, np.abs(scores - 1.0), False)
+
+            spread = np.abs(values - center)
+            scale = np.median(spread)
+            if scale == 0:
+                nonzero = spread[spread > 0]
+                scale = nonzero.mean() if len(nonzero) else 1.0
+            scores = (values - center) / scale
+            return (center, scores, np.abs(scores), True)
+
+        center = values.mean()
+        std = values.std()
+        scores = (values - center) / std if std else np.zeros_like(values)
+        return (center, scores, np.abs(scores), False)
+
+def rank(matrix, rows, metrics, method='zscore', count=10):
+    # The count most deviating (metric, CPU[, domain]) of the rows of the
+    # delta matrix, most deviating first
+    rows = np.asarray(rows, dtype=np.int64)
+    entries = []
+
+    for metric in metrics:
+        (values, is_domain) = get_metric(matrix, metric)
+        if values is None:
+            print('Error: unknown metric ', metric)
+            return None
+
+        if is_domain:
+            fleets = []
+            for j in range(matrix.domain_data.shape[1]):
+                sel = rows[matrix.num_domains[rows] > j]
+                fleets.append((sel, j, values[sel, j]))
+        else:
+            fleets = [(rows, None, values[rows])]
+
+        for (sel, level, v) in fleets:
+            v = v.astype(np.float64)
+            keep = ~np.isnan(v)
+            if not keep.any():
+                continue
+
+            sel, v = sel[keep], v[keep]
+            (center, scores, deviations, scaled) = get_scores(v, method)
+            entries.append((metric, sel, level, v, center, scores, deviations, scaled))
+
+    if not entries:
+        return []
+
+    deviations = np.nan_to_num(np.concatenate([e[6] for e in entries]), nan=-1.0)
+    values = np.abs(np.concatenate([e[3] for e in entries]))
+    starts = np.cumsum([0] + [len(e[1]) for e in entries])
+
+    outliers = []
+    for i in top_rows(deviations, count, values):
+        e = int(np.searchsorted(starts, i, side='right')) - 1
+        (metric, sel, level, v, center, scores, devs, scaled) = entries[e]
+        k = i - starts[e]
+        outliers.append(Outlier(metric, int(sel[k]), level, float(v[k]), float(center), float(scores[k]), float(devs[k]), scaled))
+
+    return outliers
+
+def get_outlier_rows(outliers):
+    # Rows of the outliers, once each, in rank order
+    rows = []
+    for o in outliers:
+        if o.row not in rows:
+            rows.append(o.row)
+
+    return rows
+
+def write_outliers(out, matrix, outliers, method, ctx=schedstat_parser.default_context):
+    writen = schedstat_parser.writen
+    center_str = 'mean' if method == 'zscore' else 'median'
+    score_str = 'zscore' if method == 'zscore' else 'ratio'
+
+    writen(out, schedstat_parser.banner_width * "-")
+    writen(out, "Outliers: top " + str(len(outliers)) + " by " + method + " against the CPUs of the cpuset")
+    writen(out, schedstat_parser.banner_width * "-")
+    writen(out, "%4s %-8s %-12s %-28s %16s %16s %10s" %("rank", "cpu", "domain", "metric", "value", center_str, score_str))
+
+    for i, o in enumerate(outliers):
+        domain = '-'
+        if o.level is not None:
+            domain = ctx.get_domain_name(matrix.domain_names[o.row][o.level])
+
+        writen(out, "%4d %-8s %-12s %-28s %16.2f %16.2f %10.3f%s"
+               %(i + 1, matrix.cpu_names[o.row], domain, o.metric, o.value, o.center, o.score, '*' if o.scaled else ''))
+
+    if any(o.scaled for o in outliers):
+        writen(out, '')
+        writen(out, "* median is 0: deviation from the median over the MAD (or over the mean")
+        writen(out, "  absolute deviation when the MAD is 0 too) instead of a ratio")
+
+    writen(out, '')
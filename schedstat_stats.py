@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Statistics of groups of repeated runs, for schedstat_comparator.py -S.
+#
+# Every metric of two groups of runs is compared with Welch's t-test (the
+# groups may have different sizes and variances): mean and standard
+# deviation of each group, confidence interval of the difference of the
+# means and two-sided p-value. All the metrics are computed at once, as
+# columns of a runs x metrics array. The Student t distribution is
+# computed here from the regularized incomplete beta function, so numpy
+# is the only dependency.
+
+import math
+import numpy as np
+
+lgamma = np.vectorize(math.lgamma, otypes=[np.float64])
+
+def betacf(a, b, x, iterations=300, eps=1e-12):
+    # Continued fraction of the incomplete beta function (modified Lentz)
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = np.ones_like(x)
+    d = 1.0 - qab * x / qap
+    d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d
+
+    for m in range(1, iterations + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        h = h * d * c
+
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        delta = d * c
+        h = h * delta
+
+        if np.all(np.abs(delta - 1.0) < eps):
+            break
+
+    return h
+
+def betainc(a, b, x):
+    # Regularized incomplete beta function I_x(a, b)
+    (a, b, x) = (np.asarray(v, dtype=np.float64) for v in np.broadcast_arrays(a, b, x))
+
+    # The continued fraction converges quickly for x < (a + 1) / (a + b + 2),
+    # I_x(a, b) = 1 - I_(1-x)(b, a) otherwise
+    swap = x > (a + 1.0) / (a + b + 2.0)
+    (a, b, x) = (np.where(swap, b, a), np.where(swap, a, b), np.where(swap, 1.0 - x, x))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        front = np.exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * np.log(x) + b * np.log1p(-x)) / a
+        r = np.where(x == 0.0, 0.0, front * betacf(a, b, x))
+
+    return np.where(swap, 1.0 - r, r)
+
+def t_pvalue(t, df):
+    # Two-sided p-value of t for a Student t distribution with df degrees
+    # of freedom
+    t = np.abs(np.asarray(t, dtype=np.float64))
+    df = np.asarray(df, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = betainc(df / 2.0, 0.5, df / (df + t * t))
+
+    return np.where(np.isinf(t), 0.0, p)
+
+def t_critical(alpha, df, iterations=100):
+    # t such that t_pvalue(t, df) == alpha, by bisection on every df at once
+    df = np.asarray(df, dtype=np.float64)
+    low = np.zeros_like(df)
+    high = np.full_like(df, 1e4)
+
+    for i in range(iterations):
+        mid = (low + high) / 2.0
+        above = t_pvalue(mid, df) > alpha
+        low = np.where(above, mid, low)
+        high = np.where(above, high, mid)
+
+    return (low + high) / 2.0
+
+class WelchTest:
+    # base and comp: runs x metrics arrays, at least 2 runs each
+    def __init__(self, base, comp, alpha=0.05):
+        base = np.asarray(base, dtype=np.float64)
+        comp = np.asarray(comp, dtype=np.float64)
+        (n1, n2) = (base.shape[0], comp.shape[0])
+
+        self.alpha = alpha
+        self.base_mean = base.mean(axis=0)
+        self.comp_mean = comp.mean(axis=0)
+        self.base_std = base.std(axis=0, ddof=1)
+        self.comp_std = comp.std(axis=0, ddof=1)
+        self.diff = self.comp_mean - self.base_mean
+
+        v1 = self.base_std ** 2 / n1
+        v2 = self.comp_std ** 2 / n2
+        se = np.sqrt(v1 + v2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Welch-Satterthwaite degrees of freedom, the pooled ones when
+            # both groups have no variance
+            df = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+            df = np.where(se == 0.0, n1 + n2 - 2, df)
+            t = self.diff / se
+
+        # Without any variance, a difference is certain
+        t = np.where(se == 0.0, np.where(self.diff == 0.0, 0.0, np.inf), t)
+        self.df = df
+        self.t = t
+        self.pvalue = t_pvalue(t, df)
+
+        margin = t_critical(alpha, df) * se
+        self.low = self.diff - margin
+        self.high = self.diff + margin
+        self.significant = self.pvalue < alpha
+
+    def get_pct(self, values):
+        # values as a pct of the baseline mean, 0 where that mean is 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.base_mean == 0.0, 0.0, values / self.base_mean * 100.0)
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Synthetic /proc/schedstat snapshots, eg. to benchmark the parser on
+# machines we do not have.
+#
+# Writes <prefix>-before, <prefix>-after and <prefix>-dmap (in the
+# domain_map.cfg format) for the given schedstat version, number of CPUs
+# and of domain levels. Level 0 is SMT (2 threads per core), level 1 MC
+# (-L CPUs per LLC), every further level spans 4 times more CPUs and the
+# last one spans all the CPUs. The after snapshot is the before one plus
+# random increments, so every counter only grows.
+
+from optparse import OptionParser
+import numpy as np
+import schedstat_parser
+
+def get_levels(num_cpus, depth, llc_size=16):
+    # [(name, span)] of the domain levels, innermost first
+    levels = []
+    span = 2
+    for j in range(depth):
+        if j == 1:
+            span = llc_size
+        elif j > 1:
+            span *= 4
+        if j == depth - 1 or span >= num_cpus:
+            span = num_cpus
+
+        name = ['SMT', 'MC', 'PKG'][j] if j < 3 else 'NUMA'
+        levels.append((name, span))
+        if span == num_cpus:
+            break
+
+    return levels
+
+def get_cpumask(first, span, num_cpus):
+    # Same format as the kernel: comma separated 32 bit words
+    mask = ((1 << span) - 1) << first
+    words = (num_cpus + 31) // 32
+    return ','.join('%08x' %((mask >> (32 * w)) & 0xffffffff) for w in reversed(range(words)))
+
+class SchedStatSynth:
+    def __init__(self, version=17, num_cpus=64, depth=3, llc_size=16, cpu_magnitude=1000000, domain_magnitude=10000, seed=0):
+        self.version = str(version)
+        self.num_cpus = num_cpus
+        self.levels = get_levels(num_cpus, depth, llc_size)
+        self.cpu_magnitude = cpu_magnitude
+        self.domain_magnitude = domain_magnitude
+        self.rng = np.random.default_rng(seed)
+
+        plan = schedstat_parser.get_parse_plan(self.version)
+        self.num_cpu_keys = len(plan.cpu_keys)
+        self.num_domain_keys = len(plan.domain_keys)
+
+        self.cpumasks = [[get_cpumask(c - c % span, span, num_cpus) for (name, span) in self.levels] for c in range(num_cpus)]
+
+    def counters(self, shape, magnitude):
+        # About one counter in 8 never moves
+        values = self.rng.integers(0, magnitude, size=shape, dtype=np.int64)
+        values[self.rng.random(shape) < 0.125] = 0
+        return values
+
+    def snapshots(self, elapsed=100000, timestamp=4295000000):
+        # (before, after) snapshots as text
+        cpu_shape = (self.num_cpus, self.num_cpu_keys)
+        domain_shape = (self.num_cpus, len(self.levels), self.num_domain_keys)
+
+        cpu_before = self.counters(cpu_shape, 1000 * self.cpu_magnitude)
+        domain_before = self.counters(domain_shape, 1000 * self.domain_magnitude)
+        cpu_after = cpu_before + self.counters(cpu_shape, self.cpu_magnitude)
+        domain_after = domain_before + self.counters(domain_shape, self.domain_magnitude)
+
+        return (self.get_text(timestamp, cpu_before, domain_before),
+                self.get_text(timestamp + elapsed, cpu_after, domain_after))
+
+    def get_text(self, timestamp, cpu_data, domain_data):
+        lines = ['version ' + self.version, 'timestamp ' + str(timestamp)]
+        with_name = int(self.version) >= 17
+
+        for c, (cpu_values, domains) in enumerate(zip(cpu_data.tolist(), domain_data.tolist())):
+            lines.append('cpu' + str(c) + ' ' + ' '.join(map(str, cpu_values)))
+
+            for j, values in enumerate(domains):
+                name = (self.levels[j][0] + ' ') if with_name else ''
+                lines.append('domain' + str(j) + ' ' + name + self.cpumasks[c][j] + ' ' + ' '.join(map(str, values)))
+
+        return '\n'.join(lines) + '\n'
+
+    def get_domain_map(self):
+        return ''.join('domain' + str(j) + ':' + name + '\n' for j, (name, span) in enumerate(self.levels))
+
+    def write(self, prefix, elapsed=100000):
+        (before, after) = self.snapshots(elapsed)
+
+        for suffix, text in ('-before', before), ('-after', after), ('-dmap', self.get_domain_map()):
+            with open(prefix + suffix, 'w') as out_file:
+                out_file.write(text)
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("-o", "--out", dest="prefix", type=str, help="prefix of the output files: <prefix>-before, <prefix>-after, <prefix>-dmap")
+    parser.add_option("-v", "--schedstat-version", dest="schedstat_ver", type=int, default=17, help="schedstat version. Default: 17")
+    parser.add_option("-c", "--cpus", dest="num_cpus", type=int, default=64, help="number of CPUs. Default: 64")
+    parser.add_option("-D", "--depth", dest="depth", type=int, default=3, help="number of domain levels. Default: 3")
+    parser.add_option("-L", "--llc-size", dest="llc_size", type=int, default=16, help="CPUs per MC domain. Default: 16")
+    parser.add_option("-m", "--cpu-magnitude", dest="cpu_magnitude", type=int, default=1000000, help="upper bound of the increment of the cpu counters between the snapshots. Default: 1000000")
+    parser.add_option("-M", "--domain-magnitude", dest="domain_magnitude", type=int, default=10000, help="upper bound of the increment of the domain counters between the snapshots. Default: 10000")
+    parser.add_option("-e", "--elapsed", dest="elapsed", type=int, default=100000, help="jiffies between the snapshots. Default: 100000")
+    parser.add_option("-s", "--seed", dest="seed", type=int, default=0, help="random seed. Default: 0")
+
+    (options, args) = parser.parse_args()
+
+    if not options.prefix:
+        print("Error: Need an output prefix")
+        exit(1)
+
+    if options.num_cpus <= 0 or options.depth <= 0:
+        print("Error: Need at least one CPU and one domain level")
+        exit(1)
+
+    if schedstat_parser.get_parse_plan(str(options.schedstat_ver)) is None:
+        exit(1)
+
+    synth = SchedStatSynth(options.schedstat_ver, options.num_cpus, options.depth, options.llc_size,
+                           options.cpu_magnitude, options.domain_magnitude, options.seed)
+    synth.write(options.prefix, options.elapsed)
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Timeline of /proc/schedstat snapshots.
+#
+# With -s <secs>, sched-scoreboard.sh appends a copy of /proc/schedstat to
+# $LOGDIR/schedstat-timeline every <secs> seconds, each one preceded by a
+#
+#   snapshot <seconds since epoch>
+#
+# marker line. The counters are cumulative, so the summary of any [t1, t2]
+# range is the delta between the two snapshots bounding it: once the file
+# offset of every snapshot is known, a range query only parses those two.
+# The offsets are kept in a <timeline>.idx sidecar which is extended, not
+# rebuilt, when the timeline grows.
+#
+# A timeline of concatenated binary records (see schedstat_binary.py) is
+# indexed by walking the record headers instead.
+
+import os
+import sys
+import json
+import mmap
+import bisect
+from optparse import OptionParser
+import schedstat_parser
+import schedstat_matrix
+
+interval_cpu_keys = ['sched_count', 'ttwu_count', 'wait_time']
+
+interval_domain_keys = {
+    'lb_count'  : ['idle_lb_count', 'busy_lb_count', 'newidle_lb_count'],
+    'lb_failed' : ['idle_lb_failed_count', 'busy_lb_failed_count', 'newidle_lb_failed_count'],
+}
+
+def find_line(mm, prefix, pos):
+    if pos == 0 and mm[:len(prefix)] == prefix:
+        return 0
+
+    pos = mm.find(b'\n' + prefix, pos)
+    if pos < 0:
+        return -1
+
+    return pos + 1
+
+class SchedStatTimeline:
+    def __init__(self, file_path, hz=1000):
+        self.file_path = file_path
+        self.index_path = file_path + '.idx'
+        self.hz = hz
+        self.size = 0
+        self.binary = False
+        # [offset, walltime, timestamp] of every snapshot, in file order
+        self.snapshots = []
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as idx_file:
+                idx = json.load(idx_file)
+            self.size = idx['size']
+            self.snapshots = idx['snapshots']
+
+        file_size = os.path.getsize(self.file_path)
+        self.binary = schedstat_matrix.is_binary(self.file_path)
+
+        if file_size < self.size:
+            self.size = 0
+            self.snapshots = []
+
+        if file_size != self.size:
+            self.build_index(file_size)
+            self.save_index()
+
+        if not self.snapshots:
+            print('Error: no snapshots found in ', self.file_path)
+            return -1
+
+        return 0
+
+    def build_index(self, file_size):
+        # The last indexed snapshot may have been incomplete, rescan it
+        pos = 0
+        if self.snapshots:
+            pos = self.snapshots.pop()[0]
+
+        if file_size == 0:
+            self.size = 0
+            return
+
+        with open(self.file_path, 'rb') as sched_file:
+            mm = mmap.mmap(sched_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            while self.binary:
+                record = schedstat_matrix.get_binary_record(mm, pos)
+                if record is None:
+                    break
+
+                self.snapshots.append([pos, record[0], record[1]])
+                pos += record[2]
+
+            while not self.binary:
+                pos = find_line(mm, b'version ', pos)
+                if pos < 0:
+                    break
+
+                start = pos
+                walltime = None
+                if pos > 0:
+                    prev = mm.rfind(b'\n', 0, pos - 1) + 1
+                    if mm[prev:pos].startswith(b'snapshot '):
+                        start = prev
+                        walltime = float(mm[prev:pos].split()[1])
+
+                timestamp = 0
+                ts_pos = mm.find(b'\n', pos) + 1
+                ts_end = mm.find(b'\n', ts_pos)
+                if ts_pos > 0 and ts_end > 0 and mm[ts_pos:ts_end].startswith(b'timestamp '):
+                    timestamp = int(mm[ts_pos:ts_end].split()[1])
+
+                self.snapshots.append([start, walltime, timestamp])
+                pos = ts_pos if ts_pos > 0 else len(mm)
+
+            mm.close()
+
+        self.size = file_size
+
+    def save_index(self):
+        with open(self.index_path, 'w') as idx_file:
+            json.dump({'size': self.size, 'snapshots': self.snapshots}, idx_file)
+
+    def num_snapshots(self):
+        return len(self.snapshots)
+
+    def get_times(self):
+        # Seconds since the first snapshot. Fall back to the jiffies
+        # timestamps when the snapshots carry no wallclock marker.
+        first = self.snapshots[0]
+
+        if all(s[1] is not None for s in self.snapshots):
+            return [s[1] - first[1] for s in self.snapshots]
+
+        return [(s[2] - first[2]) / self.hz for s in self.snapshots]
+
+    def read_snapshot(self, i, name=None):
+        matrix = schedstat_matrix.SchedStatMatrix(name)
+
+        if self.binary:
+            if matrix.parse_binary(self.file_path, self.snapshots[i][0]) != 0:
+                return None
+            return matrix
+
+        start = self.snapshots[i][0]
+        end = self.size
+        if i + 1 < len(self.snapshots):
+            end = self.snapshots[i + 1][0]
+
+        with open(self.file_path, 'rb') as sched_file:
+            sched_file.seek(start)
+            data = sched_file.read(end - start)
+
+        if matrix.parse_lines(data.decode().splitlines()) != 0:
+            return None
+
+        return matrix
+
+    def intervals(self, first=0, last=None):
+        # Streaming pass over consecutive snapshots. At most two of them are
+        # alive at a time: the older one is turned into the delta in place,
+        # so the yielded delta is only valid until the next iteration.
+        if last is None:
+            last = len(self.snapshots) - 1
+
+        prev = self.read_snapshot(first)
+        if prev is None:
+            return
+
+        for i in range(first + 1, last + 1):
+            cur = self.read_snapshot(i)
+            if cur is None or prev.reverse_subtract(cur) != 0:
+                print('Error: could not compute interval ', i - 1, '-', i)
+                return
+
+            yield (i - 1, i, prev)
+            prev = cur
+
+    def find_range(self, t_start=None, t_end=None):
+        # First snapshot at or after t_start, last one at or before t_end
+        times = self.get_times()
+
+        first = 0
+        if t_start is not None:
+            first = bisect.bisect_left(times, t_start)
+
+        last = len(times) - 1
+        if t_end is not None:
+            last = bisect.bisect_right(times, t_end) - 1
+
+        if first >= last:
+            return None
+
+        return (first, last)
+
+    def summary(self, first, last):
+        before = self.read_snapshot(first, 'file1')
+        after = self.read_snapshot(last, 'file2')
+        if before is None or after is None:
+            return None
+
+        if after.subtract(before) != 0:
+            return None
+
+        return after
+
+def get_interval_totals(delta, rows):
+    totals = []
+
+    for key in interval_cpu_keys:
+        totals.append(int(delta.cpu_data[rows, delta.cpu_col[key]].sum()))
+
+    for name, keys in interval_domain_keys.items():
+        cols = [delta.domain_col[k] for k in keys]
+        totals.append(int(delta.domain_data[rows][:, :, cols].sum()))
+
+    return totals
+
+def write_intervals(out, timeline, cpuset):
+    times = timeline.get_times()
+    names = interval_cpu_keys + list(interval_domain_keys.keys())
+
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+    schedstat_parser.writen(out, "Timeline: " + timeline.file_path + " (" + str(timeline.num_snapshots()) + " snapshots)")
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+
+    header = "%10s %10s %10s" %("start(s)", "end(s)", "jiffies")
+    for name in names:
+        header += " %16s" %(name)
+    schedstat_parser.writen(out, header)
+
+    rows = None
+    for (i, j, delta) in timeline.intervals():
+        if rows is None:
+            rows = delta.select(cpuset)
+
+        line = "%10.2f %10.2f %10d" %(times[i], times[j], delta.timestamp)
+        for v in get_interval_totals(delta, rows):
+            line += " %16d" %(v)
+        schedstat_parser.writen(out, line)
+
+def parse_range(range_str):
+    tokens = range_str.split('-')
+    t_start = float(tokens[0]) if tokens[0] else None
+    t_end = float(tokens[1]) if len(tokens) > 1 and tokens[1] else None
+    return (t_start, t_end)
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("-t", "--timeline", dest="timeline_file", type=str, help="schedstat timeline file")
+    parser.add_option("-d", "--domainmap", dest="domain_map_file", type=str, help="domain map file")
+    parser.add_option("-o", "--out", dest="out_file", type=str, help="output file name. Default: stdout", default="")
+    parser.add_option("-l", "--cpulist", dest="cpu_list", type=str, help="list of CPUs to consider. Default: All CPUs")
+    parser.add_option("-r", "--range", dest="range_str", type=str, help="start-end (in seconds from the first snapshot) of the range to summarize, either end may be omitted. Default: per interval totals")
+    parser.add_option("-z", "--hz", dest="hz", type=int, default=1000, help="jiffies per second, used when the snapshots carry no wallclock marker. Default: 1000")
+
+    (options, args) = parser.parse_args()
+
+    if not options.timeline_file:
+        print("Error: Need a schedstat timeline file")
+        exit(1)
+
+    timeline = SchedStatTimeline(options.timeline_file, options.hz)
+    if timeline.load_index() != 0:
+        exit(1)
+
+    ctx = schedstat_parser.make_context(options.domain_map_file, options.cpu_list)
+
+    if options.out_file != "":
+        out_file_p = open(options.out_file, "w")
+    else:
+        out_file_p = sys.stdout
+
+    if not options.range_str:
+        write_intervals(out_file_p, timeline, ctx.cpuset)
+        exit(0)
+
+    (t_start, t_end) = parse_range(options.range_str)
+    snapshot_range = timeline.find_range(t_start, t_end)
+    if snapshot_range is None:
+        print("Error: Need at least 2 snapshots in the range ", options.range_str)
+        exit(1)
+
+    delta = timeline.summary(snapshot_range[0], snapshot_range[1])
+    if delta is None:
+        exit(1)
+
+    (system_level_node, nodes_to_consider) = schedstat_parser.matrix_summary(delta, ctx.cpuset, ctx.get_system_level_desc(), ctx)
+    schedstat_parser.write_summary(out_file_p, delta.timestamp, system_level_node, nodes_to_consider, ctx)
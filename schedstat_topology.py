@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Topology rollups of a schedstat delta.
+#
+# The CPUs whose domain at a given level has the same cpumask share that
+# domain span (eg. an SMT core, an LLC, a NUMA node). For every level the
+# rows of the delta SchedStatMatrix are grouped by cpumask and the cpu and
+# domain counters of each group are summed in one np.add.at() pass. A span
+# at level j is the child of the level j+1 span of its CPUs, which gives the
+# hierarchy the report is printed in.
+
+import numpy as np
+import schedstat_parser
+
+categories = ['idle', 'busy', 'newidle']
+
+rollup_domain_keys = {
+    'lb_count'  : [c + '_lb_count' for c in categories],
+    'lb_failed' : [c + '_lb_failed_count' for c in categories],
+    'pull_task' : [c + '_pull_task_count' for c in categories],
+    'wakeups'   : ['ttwu_awoke_task_dcsd'],
+    'affine'    : ['ttwu_mv_task_cc'],
+}
+
+class DomainSpan:
+    def __init__(self, level, name, cpumask, rows):
+        self.level = level
+        self.name = name
+        self.cpumask = cpumask
+        self.rows = rows
+        self.cpu_sum = None
+        self.domain_sum = None
+        self.parent = None
+        self.children = []
+
+class TopologyRollup:
+    def __init__(self, matrix, rows):
+        self.matrix = matrix
+        # spans[j] : every distinct span of level j
+        self.spans = []
+
+        rows = np.asarray(rows, dtype=np.int64)
+        max_domains = matrix.domain_data.shape[1]
+
+        for j in range(max_domains):
+            sel = rows[matrix.num_domains[rows] > j]
+            if len(sel) == 0:
+                break
+
+            masks, inverse = np.unique([matrix.cpumasks[r][j] for r in sel], return_inverse=True)
+            inverse = inverse.reshape(-1)
+
+            cpu_sum = np.zeros((len(masks), matrix.cpu_data.shape[1]), dtype=np.int64)
+            domain_sum = np.zeros((len(masks), matrix.domain_data.shape[2]), dtype=np.int64)
+            np.add.at(cpu_sum, inverse, matrix.cpu_data[sel])
+            np.add.at(domain_sum, inverse, matrix.domain_data[sel, j])
+
+            order = np.argsort(inverse, kind='stable')
+            groups = np.split(sel[order], np.cumsum(np.bincount(inverse))[:-1])
+
+            level_spans = []
+            for g, (mask, members) in enumerate(zip(masks.tolist(), groups)):
+                span = DomainSpan(j, matrix.domain_names[members[0]][j], mask, members)
+                span.cpu_sum = cpu_sum[g]
+                span.domain_sum = domain_sum[g]
+                level_spans.append(span)
+
+            self.spans.append(level_spans)
+
+        self.link()
+
+    def link(self):
+        # Parent of a span is the next level span of its first CPU
+        for j in range(len(self.spans) - 1):
+            parent_of = {}
+            for parent in self.spans[j + 1]:
+                for r in parent.rows.tolist():
+                    parent_of[r] = parent
+
+            for span in self.spans[j]:
+                parent = parent_of.get(int(span.rows[0]))
+                if parent:
+                    span.parent = parent
+                    parent.children.append(span)
+
+        for level_spans in self.spans:
+            for span in level_spans:
+                span.children.sort(key=lambda s: int(self.matrix.cpu_ids[s.rows].min()))
+
+    def roots(self):
+        roots = [s for level_spans in self.spans for s in level_spans if s.parent is None]
+        roots.sort(key=lambda s: (-s.level, int(self.matrix.cpu_ids[s.rows].min())))
+        return roots
+
+    def get_totals(self, span):
+        m = self.matrix
+        totals = {}
+
+        for name, keys in rollup_domain_keys.items():
+            totals[name] = int(sum(span.domain_sum[m.domain_col[k]] for k in keys if k in m.domain_col))
+
+        totals['ttwu_count'] = int(span.cpu_sum[m.cpu_col['ttwu_count']])
+        return totals
+
+def write_topology(out, rollup, domain_map=None):
+    if domain_map is None:
+        domain_map = {}
+
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+    schedstat_parser.writen(out, "Topology level info: (sums over the CPUs of every domain span)")
+    schedstat_parser.writen(out, schedstat_parser.banner_width * "-")
+    schedstat_parser.writen(out, "%-40s %6s %12s %12s %8s %12s %12s %8s %12s"
+                            %("domain span", "cpus", "lb_count", "lb_failed", "failed%", "pull_task", "wakeups", "wakeup%", "affine"))
+
+    def write_span(span, depth):
+        t = rollup.get_totals(span)
+        name = span.name
+        if name in domain_map:
+            name = domain_map[name]
+
+        label = "  " * depth + name + " " + schedstat_parser.DomainStats().get_cpus_list(span.cpumask)
+        schedstat_parser.writen(out, "%-40s %6d %12d %12d %8.2f %12d %12d %8.2f %12d"
+                                %(label, len(span.rows), t['lb_count'], t['lb_failed'],
+                                  schedstat_parser.percentage(t['lb_failed'], t['lb_count']), t['pull_task'],
+                                  t['wakeups'], schedstat_parser.percentage(t['wakeups'], t['ttwu_count']), t['affine']))
+
+        for child in span.children:
+            write_span(child, depth + 1)
+
+    for root in rollup.roots():
+        write_span(root, 0)
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# Single file archive of per task snapshots.
+#
+# The snapshots of a phase (taskstat-before, taskstat-workload and
+# taskstat-after) are appended to one <phase>.archive file instead of being
+# written as one file per thread, each one preceded by a
+#
+#   task <tid> <length>
+#
+# header line. The offset and length of the snapshot of every tid are kept
+# in a <phase>.archive.idx sidecar, with the size and mtime of the archive
+# it describes, and rebuilt by walking the headers when it is missing or
+# either changed. When a tid is appended twice, the last snapshot wins.
+#
+# A phase captured as a directory of per tid files is still read, and
+#
+#   taskstat_archive.py -e <logdir>/taskstat-before [-o <dir>]
+#
+# exports an archive as such a directory.
+
+import os
+import json
+import mmap
+from optparse import OptionParser
+
+class TaskStatArchive:
+    def __init__(self, path):
+        self.path = path.rstrip('/')
+        self.archive_path = self.path + '.archive'
+        self.index_path = self.archive_path + '.idx'
+        self.size = 0
+        self.mtime = None
+        # tid -> [offset, length] of its snapshot, in archive order
+        self.tasks = {}
+        self.mm = None
+        self.directory = False
+
+    def exists(self):
+        return os.path.exists(self.archive_path) or os.path.isdir(self.path)
+
+    def load(self):
+        if not os.path.exists(self.archive_path):
+            if not os.path.isdir(self.path):
+                print('Error: no archive or directory found for ', self.path)
+                return -1
+
+            self.directory = True
+            self.tasks = dict.fromkeys(os.listdir(self.path))
+            return 0
+
+        self.load_index()
+        return 0
+
+    def map(self):
+        with open(self.archive_path, 'rb') as archive_file:
+            self.mm = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as idx_file:
+                idx = json.load(idx_file)
+            self.size = idx['size']
+            self.mtime = idx.get('mtime')
+            self.tasks = idx['tasks']
+
+        st = os.stat(self.archive_path)
+        if st.st_size != self.size or st.st_mtime_ns != self.mtime:
+            self.build_index(st.st_size)
+            self.save_index()
+
+    def build_index(self, file_size):
+        self.size = 0
+        self.tasks = {}
+
+        if file_size == 0:
+            return
+
+        with open(self.archive_path, 'rb') as archive_file:
+            mm = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+            pos = 0
+
+            while pos < file_size:
+                end = mm.find(b'\n', pos)
+                if end < 0:
+                    break
+
+                tokens = mm[pos:end].split()
+                if len(tokens) != 3 or tokens[0] != b'task':
+                    break
+
+                length = int(tokens[2])
+                if end + 1 + length > file_size:
+                    break
+
+                self.tasks[tokens[1].decode()] = [end + 1, length]
+                pos = end + 1 + length
+
+            mm.close()
+
+        # A truncated last record is dropped, and overwritten by the next append
+        self.size = pos
+
+    def save_index(self):
+        self.mtime = os.stat(self.archive_path).st_mtime_ns
+        with open(self.index_path, 'w') as idx_file:
+            json.dump({'size': self.size, 'mtime': self.mtime, 'tasks': self.tasks}, idx_file)
+
+    def tids(self):
+        return list(self.tasks.keys())
+
+    def read(self, tid):
+        if self.directory:
+            with open(os.path.join(self.path, tid), 'rb') as task_file:
+                return task_file.read()
+
+        if self.mm is None:
+            self.map()
+
+        (offset, length) = self.tasks[tid]
+        return self.mm[offset:offset + length]
+
+    def get_shard(self, tids):
+        # The archive restricted to tids, small enough to be sent to a worker
+        # process, which maps the archive again on its first read
+        shard = TaskStatArchive(self.path)
+        shard.size = self.size
+        shard.directory = self.directory
+        shard.tasks = {tid: self.tasks[tid] for tid in tids}
+        return shard
+
+    def read_lines(self, tid):
+        return self.read(tid).decode().splitlines(keepends=True)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+class TaskStatWriter:
+    # mode 'w' starts a new archive, 'a' appends to an existing one. The
+    # records are written through a large buffer, a few syscalls for the
+    # whole archive.
+    def __init__(self, path, mode='w', buffer_size=1 << 20):
+        self.archive = TaskStatArchive(path)
+
+        if mode == 'a' and os.path.exists(self.archive.archive_path):
+            self.archive.load_index()
+        else:
+            self.archive.size = 0
+            self.archive.tasks = {}
+
+        self.archive_file = open(self.archive.archive_path, 'r+b' if self.archive.size else 'wb', buffering=buffer_size)
+        self.archive_file.seek(self.archive.size)
+        self.archive_file.truncate()
+
+    def append(self, tid, data):
+        if isinstance(data, str):
+            data = data.encode()
+
+        header = b'task %s %d\n' %(tid.encode(), len(data))
+        self.archive_file.write(header + data)
+
+        self.archive.tasks[tid] = [self.archive.size + len(header), len(data)]
+        self.archive.size += len(header) + len(data)
+
+    def close(self):
+        self.archive_file.close()
+        self.archive.save_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def export(path, dest_dir):
+    archive = TaskStatArchive(path)
+    if archive.load() < 0:
+        return -1
+
+    os.makedirs(dest_dir, exist_ok=True)
+    for tid in archive.tids():
+        with open(os.path.join(dest_dir, tid), 'wb') as dest:
+            dest.write(archive.read(tid))
+
+    archive.close()
+    return len(archive.tasks)
+
+if __name__ == "__main__":
+    parser = OptionParser(usage='%prog -e <logdir>/taskstat-before [-o <dir>]')
+    parser.add_option("-e", "--export", dest="export_path", type=str, help="phase to export, eg. <logdir>/taskstat-before for <logdir>/taskstat-before.archive")
+    parser.add_option("-o", "--output", dest="output_dir", type=str, help="directory to write one file per task to (Default: the phase path, eg. <logdir>/taskstat-before)")
+
+    (options, args) = parser.parse_args()
+
+    if options.export_path is None:
+        print('Error: no archive to export, use -e')
+        exit(1)
+
+    export_path = options.export_path.rstrip('/')
+    if export_path.endswith('.archive'):
+        export_path = export_path[:-len('.archive')]
+
+    output_dir = options.output_dir
+    if output_dir is None:
+        output_dir = export_path
+
+    if not os.path.exists(export_path + '.archive'):
+        print('Error: no archive found at ', export_path + '.archive')
+        exit(1)
+
+    if export(export_path, output_dir) < 0:
+        exit(1)
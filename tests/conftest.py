@@ -0,0 +1,8 @@
+# SPDX-License-Identifer: GPL-2.0-only
+#
+# The scripts are flat modules at the top of the tree
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
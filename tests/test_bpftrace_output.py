@@ -0,0 +1,73 @@
+# SPDX-License-Identifer: GPL-2.0-only
+
+import json
+import bpftrace_output
+
+text_output = '''Attaching 4 probes...
+
+
+@comm[12]: 007
+@comm[13]: kworker/0:1
+@nr_wakeups[12]: 42
+@nr_wakeups[13]: -1
+@waking_pairs[12, 13, 007, kworker/0:1]: 5
+@runtime: 1000
+
+@hist:
+[0, 1)                 3 |@@@@                                                |
+'''
+
+def write_output(tmp_path, text):
+    path = tmp_path / 'pertask.bpftrace.output'
+    path.write_text(text)
+    return str(path)
+
+def test_text(tmp_path):
+    path = write_output(tmp_path, text_output)
+
+    assert list(bpftrace_output.read_maps(path, raw=['comm'])) == [
+        ('comm', ('12',), '007'),
+        ('comm', ('13',), 'kworker/0:1'),
+        ('nr_wakeups', ('12',), 42),
+        ('nr_wakeups', ('13',), -1),
+        ('waking_pairs', ('12', '13', '007', 'kworker/0:1'), 5),
+        ('runtime', (), 1000),
+    ]
+
+def test_text_maps(tmp_path):
+    path = write_output(tmp_path, text_output)
+
+    assert list(bpftrace_output.read_maps(path, ['nr_wakeups'])) == [
+        ('nr_wakeups', ('12',), 42),
+        ('nr_wakeups', ('13',), -1),
+    ]
+
+def test_text_batches(tmp_path, monkeypatch):
+    # Records are the same whatever the batches the lines are read in
+    path = write_output(tmp_path, text_output)
+    records = list(bpftrace_output.read_maps(path))
+
+    monkeypatch.setattr(bpftrace_output, 'batch_size', 1)
+    assert list(bpftrace_output.read_maps(path)) == records
+
+def test_json(tmp_path):
+    events = [
+        {'type': 'attached_probes', 'data': {'probes': 4}},
+        {'type': 'map', 'data': {'@comm': {'12': '007', '13': 'kworker/0:1'}}},
+        {'type': 'map', 'data': {'@nr_wakeups': {'12': 42}}},
+        {'type': 'map', 'data': {'@waking_pairs': {'12,13,007,a, b': 5}}},
+        {'type': 'map', 'data': {'@runtime': 1000}},
+    ]
+    path = write_output(tmp_path, ''.join(json.dumps(event) + '\n' for event in events))
+
+    assert list(bpftrace_output.read_maps(path)) == [
+        ('comm', ('12',), '007'),
+        ('comm', ('13',), 'kworker/0:1'),
+        ('nr_wakeups', ('12',), 42),
+        ('waking_pairs', ('12', '13', '007', 'a', 'b'), 5),
+        ('runtime', (), 1000),
+    ]
+    assert list(bpftrace_output.read_maps(path, ['comm'])) == [
+        ('comm', ('12',), '007'),
+        ('comm', ('13',), 'kworker/0:1'),
+    ]
@@ -0,0 +1,31 @@
+# SPDX-License-Identifer: GPL-2.0-only
+
+import io
+import pytest
+import schedstat_synth
+import schedstat_binary
+
+def convert(tmp_path, text):
+    text_path = tmp_path / 'schedstat'
+    bin_path = tmp_path / 'schedstat.bin'
+    text_path.write_text(text)
+
+    with open(bin_path, 'wb') as out_file:
+        assert schedstat_binary.text_to_binary(str(text_path), out_file) == 0
+
+    out = io.StringIO()
+    assert schedstat_binary.binary_to_text(str(bin_path), out) == 0
+    return out.getvalue()
+
+@pytest.mark.parametrize('version', [15, 16, 17])
+def test_round_trip(tmp_path, version):
+    (before, after) = schedstat_synth.SchedStatSynth(version, 8, 3, 4).snapshots()
+
+    assert convert(tmp_path, before) == before
+
+def test_timeline_round_trip(tmp_path):
+    # The walltime text keeps every digit of date +%s.%N
+    (before, after) = schedstat_synth.SchedStatSynth(17, 4, 2, 2).snapshots()
+    text = 'snapshot 1700000000.123456789\n' + before + 'snapshot 1700000001.987654321\n' + after
+
+    assert convert(tmp_path, text) == text
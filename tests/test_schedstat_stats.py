@@ -0,0 +1,25 @@
+# SPDX-License-Identifer: GPL-2.0-only
+
+import pytest
+import schedstat_stats
+
+def test_t_pvalue():
+    assert float(schedstat_stats.t_pvalue(2.0, 10.0)) == pytest.approx(0.0734, abs=1e-4)
+    assert float(schedstat_stats.t_pvalue(0.0, 10.0)) == pytest.approx(1.0)
+    assert float(schedstat_stats.t_pvalue(float('inf'), 10.0)) == 0.0
+
+def test_t_critical():
+    assert float(schedstat_stats.t_critical(0.05, 10.0)) == pytest.approx(2.2281, abs=1e-4)
+
+def test_welch():
+    welch = schedstat_stats.WelchTest([[1], [2], [3], [4], [5]], [[3], [4], [5], [6], [7]])
+
+    assert welch.t[0] == pytest.approx(2.0)
+    assert welch.df[0] == pytest.approx(8.0)
+    assert welch.pvalue[0] == pytest.approx(0.0805, abs=1e-4)
+    assert not welch.significant[0]
+
+def test_welch_no_variance():
+    welch = schedstat_stats.WelchTest([[1, 1], [1, 1]], [[1, 2], [1, 2]])
+
+    assert welch.pvalue.tolist() == [1.0, 0.0]
@@ -0,0 +1,44 @@
+# SPDX-License-Identifer: GPL-2.0-only
+
+import os
+import sys
+import subprocess
+import schedstat_synth
+import schedstat_timeline
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_timeline(tmp_path):
+    synth = schedstat_synth.SchedStatSynth(17, 8, 3, 4)
+    (before, middle) = synth.snapshots()
+    (middle, after) = synth.snapshots(elapsed=200000)
+
+    (tmp_path / 'schedstat-before').write_text(before)
+    (tmp_path / 'schedstat-after').write_text(after)
+    (tmp_path / 'schedstat-timeline').write_text('snapshot 1700000000.000000000\n' + before +
+                                                 'snapshot 1700000001.500000000\n' + middle +
+                                                 'snapshot 1700000003.000000000\n' + after)
+    return str(tmp_path / 'schedstat-timeline')
+
+def run(*args):
+    subprocess.run([sys.executable] + list(args), check=True, cwd=script_dir)
+
+def test_find_range(tmp_path):
+    timeline = schedstat_timeline.SchedStatTimeline(write_timeline(tmp_path))
+
+    assert timeline.load_index() == 0
+    assert timeline.get_times() == [0.0, 1.5, 3.0]
+    assert timeline.find_range() == (0, 2)
+    assert timeline.find_range(1, 3) == (1, 2)
+    assert timeline.find_range(0, 1) is None
+
+def test_range_summary(tmp_path):
+    # The summary of the whole timeline is the one of its first and last
+    # snapshots parsed as a before/after pair
+    timeline_path = write_timeline(tmp_path)
+
+    run('schedstat_timeline.py', '-t', timeline_path, '-r', '0-3', '-o', str(tmp_path / 'range-summary'))
+    run('schedstat_parser.py', '-b', str(tmp_path / 'schedstat-before'), '-a', str(tmp_path / 'schedstat-after'),
+        '-o', str(tmp_path / 'schedstat-summary'))
+
+    assert (tmp_path / 'range-summary').read_text() == (tmp_path / 'schedstat-summary').read_text()
@@ -0,0 +1,81 @@
+# SPDX-License-Identifer: GPL-2.0-only
+
+import os
+import taskstat_archive
+
+def write_archive(path, tasks, mode='w'):
+    with taskstat_archive.TaskStatWriter(str(path), mode) as writer:
+        for (tid, data) in tasks:
+            writer.append(tid, data)
+
+def load_archive(path):
+    archive = taskstat_archive.TaskStatArchive(str(path))
+    assert archive.load() == 0
+    return archive
+
+def test_lookup(tmp_path):
+    write_archive(tmp_path / 'taskstat-before', [('1', 'se.sum_exec_runtime : 1\n'), ('20', b'se.nr_migrations : 2\n')])
+
+    archive = load_archive(tmp_path / 'taskstat-before')
+    assert archive.tids() == ['1', '20']
+    assert archive.read('20') == b'se.nr_migrations : 2\n'
+    assert archive.read_lines('1') == ['se.sum_exec_runtime : 1\n']
+    archive.close()
+
+def test_append(tmp_path):
+    # The last snapshot of a tid wins
+    write_archive(tmp_path / 'p', [('1', 'a\n'), ('2', 'b\n')])
+    write_archive(tmp_path / 'p', [('1', 'c\n')], 'a')
+
+    archive = load_archive(tmp_path / 'p')
+    assert archive.tids() == ['1', '2']
+    assert archive.read('1') == b'c\n'
+    assert archive.read('2') == b'b\n'
+    archive.close()
+
+def test_index_rebuilt(tmp_path):
+    write_archive(tmp_path / 'p', [('1', 'a\n')])
+    os.remove(str(tmp_path / 'p.archive.idx'))
+
+    archive = load_archive(tmp_path / 'p')
+    assert archive.read('1') == b'a\n'
+    archive.close()
+
+def test_stale_index_same_size(tmp_path):
+    write_archive(tmp_path / 'p', [('1', 'a\n'), ('2', 'b\n')])
+    index = (tmp_path / 'p.archive.idx').read_text()
+
+    write_archive(tmp_path / 'p', [('3', 'c\n'), ('4', 'd\n')])
+    (tmp_path / 'p.archive.idx').write_text(index)
+    st = os.stat(str(tmp_path / 'p.archive'))
+    os.utime(str(tmp_path / 'p.archive'), ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+
+    archive = load_archive(tmp_path / 'p')
+    assert archive.tids() == ['3', '4']
+    assert archive.read('4') == b'd\n'
+    archive.close()
+
+def test_shard(tmp_path):
+    write_archive(tmp_path / 'p', [('1', 'a\n'), ('2', 'b\n'), ('3', 'c\n')])
+
+    archive = load_archive(tmp_path / 'p')
+    shard = archive.get_shard(['3', '1'])
+    assert shard.tids() == ['3', '1']
+    assert shard.read('3') == b'c\n'
+    shard.close()
+    archive.close()
+
+def test_directory(tmp_path):
+    # A phase captured as one file per tid
+    os.makedirs(str(tmp_path / 'p'))
+    (tmp_path / 'p' / '7').write_text('a\n')
+
+    archive = load_archive(tmp_path / 'p')
+    assert archive.tids() == ['7']
+    assert archive.read('7') == b'a\n'
+
+def test_export(tmp_path):
+    write_archive(tmp_path / 'p', [('1', 'a\n'), ('2', 'b\n')])
+
+    assert taskstat_archive.export(str(tmp_path / 'p'), str(tmp_path / 'out')) == 2
+    assert (tmp_path / 'out' / '2').read_text() == 'b\n'